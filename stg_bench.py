@@ -0,0 +1,398 @@
+"""STG Graph Plot のベンチマーク
+
+    python stg_bench.py [行数]                                  日時変換・プレビュー再描画の比較
+    python stg_bench.py generate 出力先 -n 行数 [--files 4]      STGのCSVファイル（ローテーション）を作成
+    python stg_bench.py suite [-n 行数 | -i GLOB] [-o 結果.json] [--compare 前回.json]
+                                                                読込・集計・プレビュー・出力の時間を計測
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from stg_graph_plot import (MEAN_TIMES, PERF, PreviewRenderer, ResampleCache, StgCache,
+                            __version__, decimate_m4, export_frame, load_stg_files, parse_stg_dates,
+                            parse_stg_dates_legacy, plot_targets, resample_stg)
+
+MONTH_ABBRS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Avg', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# 合成データを作成するときに一度に作成する行数（ファイルの重なりの行も同じ値になるよう、行番号で区切る）
+GENERATE_CHUNK_ROWS = 1_000_000
+
+
+def format_stg_dates(dates: np.ndarray) -> np.ndarray:
+    """datetime64の配列をSTG形式の日時文字列（YYYY-Mon-DD HH:MM:SS.fff、AugはAvg）の配列にする
+        固定幅の各フィールドをNumPyで書き込む（parse_stg_datesの逆）
+    """
+    dates = np.asarray(dates).astype('datetime64[ms]')
+    months = dates.astype('datetime64[M]')
+    days = dates.astype('datetime64[D]')
+    year = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12
+    day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    ms = (dates - days).astype(np.int64)
+
+    b = np.empty((len(dates), 24), dtype=np.uint8)
+
+    def put(pos, width, values):
+        for k in range(width):
+            b[:, pos + width - 1 - k] = values // 10**k % 10 + ord('0')
+
+    abbrs = np.array([[ord(c) for c in abbr] for abbr in MONTH_ABBRS], dtype=np.uint8)
+    put(0, 4, year)
+    b[:, 5:8] = abbrs[month]
+    put(9, 2, day)
+    put(12, 2, ms // 3_600_000)
+    put(15, 2, ms // 60_000 % 60)
+    put(18, 2, ms // 1000 % 60)
+    put(21, 3, ms % 1000)
+    for pos, char in ((4, '-'), (8, '-'), (11, ' '), (14, ':'), (17, ':'), (20, '.')):
+        b[:, pos] = ord(char)
+    return b.view('S24').ravel().astype('U24')
+
+
+def make_stg_dates(rows: int, start: str = '2021-07-01', interval: float = 1.0) -> pd.Series:
+    """STG形式の日時文字列（AugはAvg）のSeriesを作成する
+    """
+    dates = pd.date_range(start, periods=rows, freq=pd.Timedelta(seconds=interval))
+    dates = dates + pd.to_timedelta(np.random.randint(0, 1000, rows), unit='ms')
+    return pd.Series(format_stg_dates(dates.to_numpy()), name='date', dtype=object)
+
+
+def make_stg_rows(chunk: int, rows: int, seed: int, start: str, interval: float, restart_rows: np.ndarray,
+                  zero_ratio: float) -> pd.DataFrame:
+    """全体がrows行の合成データのchunk番目（GENERATE_CHUNK_ROWS行ごと）の行を作成する
+        同じ引数なら同じ行になる（ローテーションしたファイルの重なりの行は同じ値になる）
+        - 日時: interval秒ごと（±5ミリ秒のゆらぎ）
+        - uptime: restart_rowsの行で0から数え直す（機器の再起動）。zero_ratioの割合で0（読み取り失敗）
+        - 受信・送信: 取得間隔のByte数。日中に多い周期的な変動とゆらぎ、まれなバーストを含む
+    """
+    rng = np.random.default_rng([seed, chunk])
+    idx = np.arange(chunk * GENERATE_CHUNK_ROWS, min((chunk + 1) * GENERATE_CHUNK_ROWS, rows), dtype=np.int64)
+    rows = len(idx)
+    offset = idx * int(interval * 1e9) + rng.integers(-5, 6, rows) * 1_000_000
+    dates = np.datetime64(pd.Timestamp(start).to_datetime64(), 'ns') + offset.astype('timedelta64[ns]')
+
+    # restart_rowsの先頭は0
+    last_restart = restart_rows[np.searchsorted(restart_rows, idx, side='right') - 1]
+    uptime = ((idx - last_restart) * interval * 100).astype(np.int64) + 100     # uptimeは1/100秒単位
+    uptime[rng.random(rows) < zero_ratio] = 0
+
+    # 日中（14時頃）にピークとなるトラフィック（bps）
+    hour = (dates - dates.astype('datetime64[D]')).astype(np.int64) / 3.6e12
+    rate = 50e6 * (1.2 + np.sin((hour - 8) / 24 * 2 * np.pi)) * rng.lognormal(0, 0.2, rows)
+    rate[rng.random(rows) < 1e-4] *= 20     # バースト
+    recv = (rate * interval / 8).astype(np.int64)
+    send = (rate * interval / 8 * rng.uniform(0.2, 0.4, rows)).astype(np.int64)
+    return pd.DataFrame({'date': format_stg_dates(dates), 'uptime': uptime, 'recv': recv, 'send': send})
+
+
+def write_stg_files(outdir: str, rows: int, files: int = 4, target_ip: str = '192.168.0.1',
+                    start: str = '2021-07-01', interval: float = 1.0, overlap: int = 1000,
+                    restarts: int = 1, zero_ratio: float = 0.001, seed: int = 0, progress=None) -> list:
+    """STGがローテーションして保存したCSVファイル（合成データ）を作成する
+        ファイルは古い順に stg.csv.(files-2) ～ stg.csv.000、最新が stg.csv（STGと同じ命名）。
+        各ファイルは前のファイルの最後のoverlap行と同じ行から始まる（ローテーションの重なり）。
+        1行目はSTGのヘッダー行、2行目は列名、文字コードはSHIFT-JIS、改行はCRLF。
+        GENERATE_CHUNK_ROWS行ずつ作成して書き込むので、1億行でも使用メモリは一定。
+
+    Args:
+        outdir (str): 出力先のディレクトリ
+        rows (int): 全体の行数（重なりの行を除く）
+        files (int): ファイル数
+        target_ip (str): ターゲットアドレス
+        start (str): 最初の行の日時
+        interval (float): 取得間隔（秒）
+        overlap (int): 前のファイルと重なる行数
+        restarts (int): 機器の再起動の回数
+        zero_ratio (float): uptimeが0の行の割合
+        seed (int): 乱数のシード
+        progress (callable): 進捗の出力先 progress(メッセージ)
+
+    Returns:
+        list: 作成したファイル名のリスト（古い順）
+    """
+    progress = progress or (lambda text: None)
+    os.makedirs(outdir, exist_ok=True)
+    restart_rows = np.sort(np.random.default_rng(seed).integers(1, max(rows, 2), restarts))
+    restart_rows = np.concatenate([[0], restart_rows])
+    bounds = np.linspace(0, rows, files + 1).astype(np.int64)
+    filenames = []
+    for k in range(files):
+        name = 'stg.csv' if k == files - 1 else f'stg.csv.{files - 2 - k:03d}'
+        filename = os.path.join(outdir, name)
+        first, last = max(bounds[k] - (overlap if k else 0), 0), bounds[k + 1]
+        with open(filename, 'w', encoding='SHIFT-JIS', newline='') as f:
+            f.write(f'STG,Target Address:{target_ip},OID:1.3.6.1.2.1.2.2.1.10.1,OID:1.3.6.1.2.1.2.2.1.16.1,'
+                    f'Interval:{interval:g}\r\n')
+            f.write('Date,Uptime,Recv,Send\r\n')
+            for chunk in range(first // GENERATE_CHUNK_ROWS, (last - 1) // GENERATE_CHUNK_ROWS + 1):
+                df = make_stg_rows(chunk, rows, seed, start, interval, restart_rows, zero_ratio)
+                lo = max(first - chunk * GENERATE_CHUNK_ROWS, 0)
+                hi = min(last - chunk * GENERATE_CHUNK_ROWS, GENERATE_CHUNK_ROWS)
+                df.iloc[lo:hi].to_csv(f, header=False, index=False, lineterminator='\r\n')
+        progress(f'  "{filename}" {last - first:,} 行\n')
+        filenames.append(filename)
+    return filenames
+
+
+def timeit(func, *args, repeat: int = 3) -> tuple:
+    """repeat回実行した最短時間と最後の結果を返す
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - t1)
+    return best, result
+
+
+def bench_parse_dates(rows: int):
+    """日時文字列の変換（str.replace + to_datetime と parse_stg_dates）を比較する
+    """
+    dates = make_stg_dates(rows)
+    t_legacy, legacy = timeit(parse_stg_dates_legacy, dates)
+    t_new, new = timeit(parse_stg_dates, dates)
+    pd.testing.assert_series_equal(legacy, new)
+    print(f'日時変換 {rows:,} 行')
+    print(f'  str.replace + to_datetime : {t_legacy:.3f} sec')
+    print(f'  parse_stg_dates           : {t_new:.3f} sec ({t_legacy / t_new:.1f}x)')
+
+
+def make_stg_frame(rows: int, start: str = '2021-07-01', interval: float = 1.0) -> pd.DataFrame:
+    """load_stg_filesで読み込んだ形式（日時のインデックス、recv、send、delta_time）のDataFrameを作成する
+    """
+    index = pd.date_range(start, periods=rows, freq=pd.Timedelta(seconds=interval), name='date')
+    counters = np.random.randint(0, 1_000_000, (rows, 2))
+    return pd.DataFrame({
+        'recv': counters[:, 0].astype(np.uint32),
+        'send': counters[:, 1].astype(np.uint32),
+        'delta_time': np.full(rows, interval, dtype=np.float32),
+    }, index=index)
+
+
+def bench_redraw(rows: int, repeat: int = 10):
+    """プレビューの再描画（ax.cla() + df.plot と PreviewRenderer）の時間を比較する
+        集計単位と縦軸の単位を切り替えながら、描画（Agg）までの時間を測定する
+    """
+    df = make_stg_frame(rows)
+    conditions = [('1T', 'Mbps'), ('5T', 'kbps'), ('10T', 'Mbps'), ('1H', 'Gbps')]
+    results = [
+        [('192.168.0.1', resample_stg(df, rule, axis_unit=unit))] for rule, unit in conditions
+    ]
+
+    def redraw(draw):
+        fig = Figure()
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        draw(ax, results[-1])
+        canvas.draw()
+        times = []
+        for i in range(repeat):
+            t1 = time.perf_counter()
+            draw(ax, results[i % len(results)])
+            canvas.draw()
+            times.append(time.perf_counter() - t1)
+        return np.median(times)
+
+    def replot(ax, result):
+        ax.cla()
+        plot_targets(ax, result, '1分平均')
+
+    renderer = None
+
+    def update(ax, result):
+        nonlocal renderer
+        renderer = renderer or PreviewRenderer(ax)
+        renderer.draw(result, '1分平均')
+
+    t_legacy = redraw(replot)
+    t_new = redraw(update)
+    print(f'プレビュー再描画 {rows:,} 行（中央値）')
+    print(f'  ax.cla() + df.plot : {t_legacy * 1000:.1f} ms')
+    print(f'  PreviewRenderer    : {t_new * 1000:.1f} ms ({t_legacy / t_new:.1f}x)')
+
+
+def run_suite(filenames: list, workdir: str, repeat: int = 1, width: int = 800) -> dict:
+    """STGのCSVファイルの読込、集計単位ごとの集計、プレビューの描画、CSVファイル出力の時間を計測する
+
+    Args:
+        filenames (list): CSVファイル名のリスト
+        workdir (str): キャッシュと出力ファイルの作業ディレクトリ
+        repeat (int): 繰り返し回数（最短時間を記録する）
+        width (int): プレビューの描画領域のピクセル幅（間引きの区間数）
+
+    Returns:
+        dict: 計測項目ごとの時間（sec）と、読込の処理ごとの時間
+    """
+    results = {}
+
+    def record(name, func, *args):
+        t, value = timeit(func, *args, repeat=repeat)
+        results[name] = t
+        print(f'  {name:<24} {t:10.3f} sec')
+        return value
+
+    # 読込（キャッシュなし・キャッシュあり）、読込の処理ごとの時間
+    PERF.clear()
+    df, _, target_ip = record('ingest', load_stg_files, filenames)
+    stages = {
+        stage: {'wall': row.wall / repeat, 'rows_out': None if pd.isna(row.rows_out) else int(row.rows_out / repeat)}
+        for stage, row in PERF.summary().iterrows()
+    }
+    cache = StgCache(os.path.join(workdir, 'cache'))
+    load_stg_files(filenames, cache)
+    record('ingest_cached', load_stg_files, filenames, cache)
+
+    # 集計単位ごとの集計（元データから）と、全集計単位の集計（ResampleCache.build）
+    for name, rule in MEAN_TIMES.items():
+        record(f'resample/{rule}', resample_stg, df, rule)
+    resample_cache = ResampleCache()
+    record('pyramid', lambda: (resample_cache.clear(), resample_cache.build(df)))
+
+    # プレビュー（集計済みのデータから、間引き、描画まで）
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    renderer = PreviewRenderer(fig.add_subplot())
+
+    def preview(rule, name):
+        resampled = resample_stg(df, rule, cache=resample_cache)
+        frame, recv_unit, send_unit, *rest = resampled
+        idx = decimate_m4(frame.index.asi8, [frame[recv_unit], frame[send_unit]], width)
+        renderer.draw([(target_ip, (frame.iloc[idx], recv_unit, send_unit, *rest))], name)
+        canvas.draw()
+
+    for name, rule in MEAN_TIMES.items():
+        preview(rule, name)     # 1回目は系列を作成するため計測しない
+        record(f'preview/{rule}', preview, rule, name)
+
+    # CSVファイル出力（生データのスループット）
+    frame, recv_unit, send_unit, *_ = resample_stg(df, 'org')
+    record('export/csv', export_frame, frame[['delta_time', recv_unit, send_unit]], os.path.join(workdir, 'org.csv'))
+
+    return {'rows': len(df), 'results': results, 'stages': stages}
+
+
+def environment() -> dict:
+    """計測環境（バージョン、プラットフォーム）
+    """
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'stg_graph_plot': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare_results(base: dict, current: dict):
+    """2つの計測結果を比較して表示する（比は 前回 / 今回、1より大きければ速くなった）
+    """
+    print(f'比較：{base["environment"]["time"]}（pandas {base["environment"]["pandas"]}） → '
+          f'{current["environment"]["time"]}（pandas {current["environment"]["pandas"]}）')
+    for name, t in current['results'].items():
+        if name in base['results']:
+            b = base['results'][name]
+            print(f'  {name:<24} {b:10.3f} → {t:10.3f} sec ({b / t if t else float("inf"):.2f}x)')
+
+
+def suite_main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.input:
+            filenames = sorted({f for pattern in args.input for f in glob.glob(pattern)})
+            if not filenames:
+                sys.exit(f'ファイルがありません: {" ".join(args.input)}')
+            generate = None
+        else:
+            print(f'合成データ作成 {args.rows:,} 行（{args.files} files）')
+            t1 = time.perf_counter()
+            filenames = write_stg_files(os.path.join(workdir, 'data'), args.rows, args.files, seed=args.seed,
+                                        progress=lambda text: print(text, end=''))
+            generate = time.perf_counter() - t1
+        print(f'計測（{len(filenames)} files、最短 / {args.repeat} 回）')
+        result = {
+            'environment': environment(),
+            'input': {
+                'files': len(filenames),
+                'bytes': sum(os.path.getsize(f) for f in filenames),
+                'generated': generate is not None,
+                'generate_sec': generate,
+            },
+            'repeat': args.repeat,
+            **run_suite(filenames, workdir, args.repeat),
+        }
+
+    output = args.output or f'stg_bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json'
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f'計測結果："{os.path.abspath(output)}"')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare_results(json.load(f), result)
+
+
+def main(argv: list = None):
+    argv = sys.argv[1:] if argv is None else argv
+    # 従来の使い方（引数なし、または行数のみ）は日時変換・プレビュー再描画の比較
+    if not argv or argv[0].isdigit():
+        argv = ['micro'] + argv
+    parser = argparse.ArgumentParser(description='STG Graph Plot のベンチマーク')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('micro', help='日時変換・プレビュー再描画の比較')
+    p.add_argument('rows', nargs='?', type=int, default=1_000_000, help='行数')
+
+    p = sub.add_parser('generate', help='STGのCSVファイル（ローテーション）の合成データを作成する')
+    p.add_argument('outdir', help='出力先のディレクトリ')
+    p.add_argument('-n', '--rows', type=int, default=1_000_000, help='全体の行数（最大1億行程度）')
+    p.add_argument('--files', type=int, default=4, help='ファイル数')
+    p.add_argument('--target-ip', default='192.168.0.1', help='ターゲットアドレス')
+    p.add_argument('--start', default='2021-07-01', help='最初の行の日時')
+    p.add_argument('--interval', type=float, default=1.0, help='取得間隔（秒）')
+    p.add_argument('--overlap', type=int, default=1000, help='前のファイルと重なる行数')
+    p.add_argument('--restarts', type=int, default=1, help='機器の再起動の回数')
+    p.add_argument('--zero-ratio', type=float, default=0.001, help='uptimeが0の行の割合')
+    p.add_argument('--seed', type=int, default=0, help='乱数のシード')
+
+    p = sub.add_parser('suite', help='読込・集計・プレビュー・出力の時間を計測し、JSONファイルに出力する')
+    p.add_argument('-n', '--rows', type=int, default=1_000_000, help='合成データの行数')
+    p.add_argument('--files', type=int, default=4, help='合成データのファイル数')
+    p.add_argument('--seed', type=int, default=0, help='合成データの乱数のシード')
+    p.add_argument('-i', '--input', nargs='+', metavar='GLOB', help='合成データの代わりに使うCSVファイル')
+    p.add_argument('-r', '--repeat', type=int, default=1, help='繰り返し回数（最短時間を記録する）')
+    p.add_argument('-o', '--output', help='計測結果のJSONファイル（省略時は stg_bench_日時.json）')
+    p.add_argument('--compare', metavar='JSON', help='比較する前回の計測結果のJSONファイル')
+    args = parser.parse_args(argv)
+
+    # ベンチマークの計測はパフォーマンスのログに記録しない
+    PERF.log_file = None
+    if args.command == 'micro':
+        bench_parse_dates(args.rows)
+        bench_redraw(min(args.rows, 100_000))
+    elif args.command == 'generate':
+        print(f'合成データ作成 {args.rows:,} 行（{args.files} files）')
+        write_stg_files(
+            args.outdir, args.rows, args.files, args.target_ip, args.start, args.interval, args.overlap,
+            args.restarts, args.zero_ratio, args.seed, progress=lambda text: print(text, end=''),
+        )
+    else:
+        suite_main(args)
+
+
+if __name__ == '__main__':
+    main()
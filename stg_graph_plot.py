@@ -1,51 +1,2751 @@
+import argparse
+import contextlib
+import cProfile
 import datetime
+import functools
+import glob
+import gzip
+import hashlib
+import html
+import io
+import json
 import os
+import queue
 import re
+import socket
+import sys
 import threading
 import time
+import tracemalloc
+import weakref
 import tkinter as tk
 import tkinter.scrolledtext as tkst
 import tkinter.ttk as ttk
+from collections import OrderedDict
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from tkinter import filedialog, messagebox
+from urllib.parse import parse_qs, urlparse
 
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 # from matplotlib.backend_bases import key_press_handler
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,
                                                NavigationToolbar2Tk)
 from matplotlib.figure import Figure
 from matplotlib.ticker import AutoMinorLocator
+from pandas.tseries.frequencies import to_offset
+
+try:
+    import pyarrow  # noqa: F401  Feather形式のキャッシュに使用（なければNumPy形式）
+except ImportError:
+    pyarrow = None
+try:
+    import psutil   # 使用メモリの計測に使用（なければ/proc/self/statm、どちらもなければ計測しない）
+except ImportError:
+    psutil = None
 
 __version__ = '1.1.1'
 plt.style.use('ggplot')
 font = {'family': 'meiryo'}
 plt.rc('font', **font)
 
-# 集計単位の選択肢
-MEAN_TIMES = {
-    '生データ': 'org',
-    '10秒平均': '10S',
-    '15秒平均': '15S',
-    '30秒平均': '30S',
-    '1分平均': '1T',
-    '2分平均': '2T',
-    '5分平均': '5T',
-    '10分平均': '10T',
-    '15分平均': '15T',
-    '30分平均': '30T',
-    '1時間平均': '1H',
-    '3時間平均': '3H',
-    '6時間平均': '6H',
-    '12時間平均': '12H',
-    '1日平均': '1D',
-}
+# 集計単位の選択肢
+MEAN_TIMES = {
+    '生データ': 'org',
+    '10秒平均': '10S',
+    '15秒平均': '15S',
+    '30秒平均': '30S',
+    '1分平均': '1T',
+    '2分平均': '2T',
+    '5分平均': '5T',
+    '10分平均': '10T',
+    '15分平均': '15T',
+    '30分平均': '30T',
+    '1時間平均': '1H',
+    '3時間平均': '3H',
+    '6時間平均': '6H',
+    '12時間平均': '12H',
+    '1日平均': '1D',
+}
+
+# 読込済みCSVファイルのキャッシュ
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.stg_graph_plot', 'cache')
+CACHE_MAX_BYTES = 1024**3   # キャッシュの容量の上限
+CACHE_VERSION = 3           # キャッシュの形式を変更したら値を上げる
+
+# 長期間の履歴を保存するストア（ターゲットごとのディレクトリに1日1ファイルのNumPy形式で保存する）
+STORE_DIR = os.path.join(os.path.expanduser('~'), '.stg_graph_plot', 'store')
+STORE_DTYPE = np.dtype([('date', '<i8'), ('recv', '<i8'), ('send', '<i8'), ('delta_time', '<f4')])
+
+# 追従モードで追記中のCSVファイルを確認する間隔（ミリ秒）
+FOLLOW_INTERVAL_MS = 5000
+
+# スループットの補正
+#   取得間隔の中央値のSTG_GAP_FACTOR倍を超える間隔は欠測、1/STG_GAP_FACTOR以下の間隔は異常な間隔とみなす
+#   取得間隔の中央値は先頭STG_INTERVAL_ROWS行から求める（分割して読み込んでも同じ基準で判定するため）
+STG_GAP_FACTOR = 10
+STG_INTERVAL_ROWS = 10_000
+
+# ストリーミング集計で一度に読み込む行数
+STREAM_CHUNK_ROWS = 1_000_000
+
+# データの出力形式（拡張子: 表示名）と、一度に書き込む行数
+EXPORT_FORMATS = {
+    'csv': 'CSV',
+    'csv.gz': 'CSV（gzip圧縮）',
+    'parquet': 'Parquet',
+    'feather': 'Feather',
+}
+EXPORT_CHUNK_ROWS = 500_000
+
+# バックグラウンド処理のワーカー数と、進捗を確認する間隔（ミリ秒）
+JOB_WORKERS = 3
+JOB_POLL_MS = 100
+
+# プレビューの拡大・移動後に、表示範囲のデータを間引き直すまでの待ち時間（ミリ秒）
+ZOOM_DEBOUNCE_MS = 200
+# プレビューを拡大して選択中の集計単位では描画領域の幅を埋められなくなったら、より細かいデータ
+# （集計済みの細かい集計単位、または元データ）で表示する（zoom_frame参照）。表示範囲の行数の上限
+ZOOM_MAX_ROWS = 200_000
+
+# 異常検知
+#   ANOMALY_RULEの集計単位の区間ごとに、直前ANOMALY_WINDOW区間の中央値とMAD（中央絶対偏差）を基準として判定する
+#   - バースト: 区間の最大スループットが、最大スループットの基準の中央値＋ANOMALY_SIGMA×σ（MAD×1.4826）を超え、
+#     中央値の2倍以上
+#   - 平坦: 区間内のスループットの幅が最大値のANOMALY_FLAT_TOLERANCE以下（カウンタの停止など）の区間が
+#     ANOMALY_FLAT_MIN区間以上続く
+#   - レベル変化: 直後ANOMALY_WINDOW区間の平均スループットの中央値が、基準の中央値からANOMALY_SHIFT_SIGMA×σを超え、
+#     ANOMALY_SHIFT_RATIOの割合以上変化した
+#   - 閾値超過: 区間の平均スループットが閾値（統計情報の閾値）を超えた（連続した区間は1つにまとめる）
+ANOMALY_RULE = '1T'
+ANOMALY_WINDOW = 60
+ANOMALY_SIGMA = 6
+ANOMALY_FLAT_MIN = 15
+ANOMALY_FLAT_TOLERANCE = 0.02
+ANOMALY_SHIFT_SIGMA = 4
+ANOMALY_SHIFT_RATIO = 0.5
+ANOMALY_MIN_BPS = 1000      # σの下限（トラフィックがほぼない区間で小さな変動を検出しないため）
+ANOMALY_KINDS = {
+    'burst': 'バースト',
+    'flatline': '平坦',
+    'level_shift': 'レベル変化',
+    'threshold': '閾値超過',
+}
+
+# ダッシュボード（Webサーバー）
+#   認証がないため、通常はこのPCからのみ表示できるループバックアドレスで待ち受ける。
+#   メニューで「他のPCに公開」を選んだ場合のみ、すべてのネットワークインターフェース（空文字列）で待ち受ける。
+DASHBOARD_HOST = '127.0.0.1'
+DASHBOARD_PUBLIC_HOST = ''
+DASHBOARD_PORT = 8050
+DASHBOARD_WORKERS = 2                   # グラフ・CSVを作成するワーカー数
+DASHBOARD_RESULTS = 32                  # 集計結果のキャッシュの件数
+DASHBOARD_CACHE_BYTES = 256 * 2**20     # 作成したグラフ・CSVのキャッシュの容量
+DASHBOARD_FIGSIZE = (10, 6)             # グラフのサイズ（インチ）
+
+# 処理ごとの計測（パフォーマンス）
+#   計測結果はPERF_LOGにJSON Lines形式で追記し、プロファイル取得時はPERF_PROFILE_DIRに保存する
+PERF_LOG = os.path.join(os.path.expanduser('~'), '.stg_graph_plot', 'perf.jsonl')
+PERF_PROFILE_DIR = os.path.join(os.path.expanduser('~'), '.stg_graph_plot', 'profile')
+PERF_MAX_RECORDS = 10000    # メモリに保持する計測結果の上限
+PERF_LOG_MAX_BYTES = 10 * 1024**2   # ログファイルの容量の上限（超えたら .1 に移して新しく作る）
+PERF_STAGES = {
+    'header': 'ヘッダーチェック',
+    'parse': 'CSV解析',
+    'date': '日時変換',
+    'filter': '行の除外',
+    'concat': '結合',
+    'dedup_sort': '重複削除・ソート',
+    'delta': 'delta_time計算',
+    'repair': 'カウンタ補正',
+    'resample': '集計',
+    'plot': '描画',
+    'anomaly': '異常検知',
+    'export': '出力',
+}
+
+# 日時文字列の月の略称と月番号の対応（STGのバグでAugがAvgになっているものも含む）
+STG_MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Avg': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+
+def now(format: str = '%Y-%m-%d %H:%M:%S') -> str:
+    """現在時刻文字列を返す
+    """
+    return datetime.datetime.now().strftime(format)
+
+
+def _month_key(abbr) -> np.ndarray:
+    """月の略称（3バイト）を照合用の整数に変換する
+    """
+    abbr = np.asarray(abbr, dtype=np.int64)
+    return (abbr[..., 0] << 16) | (abbr[..., 1] << 8) | abbr[..., 2]
+
+
+# 月の略称の照合テーブル（整数キーの昇順）
+_MONTH_KEYS = _month_key([[ord(c) for c in k] for k in STG_MONTHS])
+_MONTH_ORDER = np.argsort(_MONTH_KEYS)
+_MONTH_KEYS = _MONTH_KEYS[_MONTH_ORDER]
+_MONTH_VALUES = np.array(list(STG_MONTHS.values()), dtype=np.int64)[_MONTH_ORDER]
+
+
+def memory_usage() -> int:
+    """使用メモリ（byte）を返す（計測できない場合はNone）
+        tracemalloc取得中はPythonで確保したメモリ（NumPyの配列を含む）、それ以外はプロセスの使用メモリ
+    """
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PerfRecorder():
+    """処理ごとの実行時間、入出力の行数、使用メモリの増減を記録する
+        記録はスレッドセーフで、PERF_LOGにJSON Lines形式で追記する。
+        プロファイル取得（set_profile）中は、処理ごとにcProfileの結果をPERF_PROFILE_DIRに保存し、
+        使用メモリはtracemallocで計測する。
+    """
+    def __init__(self, log_file: str = PERF_LOG, max_records: int = PERF_MAX_RECORDS):
+        self.log_file = log_file
+        self.max_records = max_records
+        self.records = []
+        self.profile = False
+        self.lock = threading.Lock()
+        self.local = threading.local()      # スレッドごとの処理のネストの深さ
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """処理を計測するコンテキストマネージャ
+            with PERF.stage('parse') as rec: ... rec['rows_out'] = len(df)
+
+        Args:
+            name (str): 処理名（PERF_STAGESのキー）
+            rows_in (int): 入力の行数
+        """
+        rec = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+        depth = getattr(self.local, 'depth', 0)
+        profiler = None
+        if self.profile and depth == 0:
+            # cProfileは同じスレッドで1つしか有効にできないため、最も外側の処理だけ取得する
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                profiler = None
+        self.local.depth = depth + 1
+        mem = memory_usage()
+        t1 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec['wall'] = time.perf_counter() - t1
+            self.local.depth = depth
+            if profiler is not None:
+                profiler.disable()
+                self._dump_profile(profiler, name)
+            mem_end = memory_usage()
+            rec['mem_delta'] = None if mem is None or mem_end is None else mem_end - mem
+            rec['time'] = now('%Y-%m-%d %H:%M:%S.%f')
+            rec['thread'] = threading.current_thread().name
+            self.add(rec)
+
+    def timed(self, name: str):
+        """関数の実行を計測するデコレータ
+            入力の行数は最初のDataFrameの引数、出力の行数は戻り値（tupleなら最初の要素）のDataFrameの行数
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                rows_in = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+                with self.stage(name, rows_in) as rec:
+                    result = func(*args, **kwargs)
+                    out = result[0] if isinstance(result, tuple) and result else result
+                    if isinstance(out, pd.DataFrame):
+                        rec['rows_out'] = len(out)
+                    return result
+            return wrapper
+        return decorator
+
+    def add(self, rec: dict):
+        with self.lock:
+            self.records.append(rec)
+            del self.records[:-self.max_records]
+            if self.log_file is None:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+                if os.path.exists(self.log_file) and os.path.getsize(self.log_file) > PERF_LOG_MAX_BYTES:
+                    os.replace(self.log_file, self.log_file + '.1')
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            except OSError:
+                pass    # ログが書けなくても処理は続ける
+
+    def _dump_profile(self, profiler, name: str):
+        try:
+            os.makedirs(PERF_PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PERF_PROFILE_DIR, f'{now("%Y%m%d_%H%M%S_%f")}_{name}.prof'))
+        except OSError:
+            pass
+
+    def set_profile(self, enabled: bool):
+        """プロファイル取得（cProfile、tracemalloc）を切り替える
+        """
+        self.profile = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    def summary(self) -> pd.DataFrame:
+        """処理ごとの回数、時間、入出力の行数、使用メモリの増減の合計を返す（PERF_STAGESの順）
+        """
+        with self.lock:
+            records = list(self.records)
+        columns = ['calls', 'wall', 'rows_in', 'rows_out', 'mem_delta']
+        if not records:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame(records)
+        df['calls'] = 1
+        summary = df.groupby('stage')[columns].sum(min_count=1)
+        order = [stage for stage in PERF_STAGES if stage in summary.index]
+        return summary.loc[order + [stage for stage in summary.index if stage not in PERF_STAGES]]
+
+
+PERF = PerfRecorder()
+
+
+def parse_stg_dates_legacy(dates: pd.Series) -> pd.Series:
+    """STGの日時文字列を変換する（文字列置換＋書式指定による変換）
+    """
+    # STGのバグでAugがAvgになっているので、置換して日時認識する
+    return pd.to_datetime(dates.str.replace('Avg', 'Aug'), format="%Y-%b-%d %H:%M:%S.%f")
+
+
+def parse_stg_dates(dates: pd.Series) -> pd.Series:
+    """STGの日時文字列（YYYY-Mon-DD HH:MM:SS.fff）を変換する
+        固定幅の各フィールドをNumPyで切り出して整数化し、datetime64[ns]を直接組み立てる。
+        月の略称はテーブルで変換するため、Avg（STGのバグ）の置換は不要。
+        固定幅でない行が含まれる場合は parse_stg_dates_legacy で変換する。
+
+    Args:
+        dates (pd.Series): 日時文字列のSeries
+
+    Returns:
+        pd.Series: datetime64[ns]のSeries
+    """
+    try:
+        raw = dates.to_numpy().astype('S')
+    except (UnicodeError, ValueError, TypeError):
+        return parse_stg_dates_legacy(dates)
+    width = raw.dtype.itemsize
+    # 小数部は1～9桁
+    if len(raw) == 0 or not 21 <= width <= 29:
+        return parse_stg_dates_legacy(dates)
+
+    b = raw.view(np.uint8).reshape(len(raw), width)
+    # 区切り文字の位置が固定であること
+    for pos, char in ((4, b'-'), (8, b'-'), (11, b' '), (14, b':'), (17, b':'), (20, b'.')):
+        if not (b[:, pos] == ord(char)).all():
+            return parse_stg_dates_legacy(dates)
+    # 数字の位置がすべて数字であること（短い行は末尾が\0になるのでここで除外される）
+    digit_pos = [0, 1, 2, 3, 9, 10, 12, 13, 15, 16, 18, 19] + list(range(21, width))
+    digits = b[:, digit_pos] - np.uint8(ord('0'))
+    if not (digits <= 9).all():
+        return parse_stg_dates_legacy(dates)
+    digits = digits.astype(np.int64)
+
+    def field(start, stop):
+        value = np.zeros(len(raw), dtype=np.int64)
+        for col in range(start, stop):
+            value = value * 10 + digits[:, col]
+        return value
+
+    year = field(0, 4)
+    day = field(4, 6)
+    hour = field(6, 8)
+    minute = field(8, 10)
+    second = field(10, 12)
+    frac = field(12, digits.shape[1]) * 10 ** (9 - (width - 21))
+
+    # 月の略称をテーブルで月番号に変換する
+    keys = _month_key(b[:, 5:8])
+    idx = np.searchsorted(_MONTH_KEYS, keys).clip(max=len(_MONTH_KEYS) - 1)
+    if not (_MONTH_KEYS[idx] == keys).all():
+        return parse_stg_dates_legacy(dates)
+    month = _MONTH_VALUES[idx]
+
+    # 日はその月の日数以内であること（2月30日などを翌月に繰り越さず、legacyと同じくValueErrorにする）
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    month_days = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    if ((day < 1) | (day > month_days) | (hour > 23) | (minute > 59) | (second > 59)).any():
+        return parse_stg_dates_legacy(dates)
+
+    # 年月 → 月初の日時、に日時分秒を加算する
+    ns = months.astype('datetime64[ns]').view(np.int64)
+    ns = ns + (((day - 1) * 24 + hour) * 60 + minute) * 60 * 10**9 + second * 10**9 + frac
+    return pd.Series(ns.view('datetime64[ns]'), index=dates.index, name=dates.name)
+
+
+def compact_counter(counter: pd.Series) -> pd.Series:
+    """カウンタの列を値が収まる最小の整数型に変換する
+    """
+    counter = pd.to_numeric(counter, downcast='unsigned')   # 負の値があれば変換されない
+    if counter.dtype.kind == 'u':
+        return counter
+    return pd.to_numeric(counter, downcast='integer')
+
+
+def throughput(counter: pd.Series, delta_time: pd.Series, div_unit: int = 1) -> pd.Series:
+    """カウンタ値（byte）と取得間隔（秒）からスループット（bps / div_unit）を計算する
+        カウンタは最小の整数型に変換しているため、8倍する前にfloat64に変換する（オーバーフロー防止）
+        小数点以下の切り捨ては、浮動小数点数の//（floor_divide）より大幅に速いnp.floor(x / y)で行う
+    """
+    return np.floor(counter.astype(np.float64) * 8 / delta_time.astype(np.float64)) / div_unit
+
+
+def throughput_into(counter: np.ndarray, delta_time: np.ndarray, div_unit: int, out: np.ndarray) -> np.ndarray:
+    """throughputと同じ計算を、一時配列を作らずにoutに書き込む（outはfloat64の配列）
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.multiply(counter, 8, out=out, dtype=np.float64)     # カウンタの型で掛けるとオーバーフローする
+        np.divide(out, delta_time, out=out)
+        np.floor(out, out=out)
+        if div_unit != 1:
+            np.divide(out, div_unit, out=out)
+    return out
+
+
+class ThroughputBuffer():
+    """スループットの計算結果（受信・送信の2行のfloat64の配列）を書き込む再利用可能なバッファ
+        表示中の結果と集計中の結果の2つの配列を持ち、acquireは表示中でない方の配列を返す。
+        表示中の配列は、集計結果を描画したときにcommitで切り替える。
+        集計を中止した（描画しなかった）結果の配列は次の集計で再利用し、表示中の結果は上書きしない。
+        プレビューは集計を1つずつ行う（ButtonFrame.preview_graph参照）。
+    """
+    def __init__(self):
+        self.slots = [np.empty((2, 0)), np.empty((2, 0))]
+        self.shown = 1          # 表示中の結果の配列
+        self.written = None     # 最後にacquireした（まだ表示していない）配列
+        self.lock = threading.Lock()
+
+    def acquire(self, rows: int) -> np.ndarray:
+        """表示中でない方のrows列の配列を返す（足りなければ大きくする）
+        """
+        with self.lock:
+            slot = 1 - self.shown
+            self.written = slot
+            if self.slots[slot].shape[1] < rows:
+                self.slots[slot] = np.empty((2, rows))
+            return self.slots[slot][:, :rows]
+
+    def commit(self):
+        """最後にacquireした配列の結果を表示したことを記録する（以降のacquireで上書きしない）
+        """
+        with self.lock:
+            if self.written is not None:
+                self.shown = self.written
+                self.written = None
+
+
+def period_slice(df: pd.DataFrame, date_from: str = None, date_to: str = None) -> pd.DataFrame:
+    """指定期間（日付、終了日はその日の終わりまで）の行を、日時のインデックスの二分探索で求めて返す
+        コピーせずに元のDataFrameのビューを返す（変更しないこと）
+    """
+    index = df.index.asi8
+    start = 0 if not date_from else np.searchsorted(index, pd.Timestamp(date_from).value, side='left')
+    if not date_to:
+        stop = len(index)
+    else:
+        stop = np.searchsorted(index, (pd.Timestamp(date_to) + pd.Timedelta(days=1)).value, side='left')
+    return df.iloc[start:stop]
+
+
+def clean_stg_frame(df: pd.DataFrame):
+    """読み込んだSTGのDataFrameを整形する（inplace）
+        日時の変換とuptimeが0の行の削除を行い、
+        メモリ使用量を減らすため、uptimeとカウンタの列を値が収まる最小の整数型に変換する
+        （uptimeの列は repair_stg_frame で機器の再起動の検出に使ってから削除する）
+    """
+    # 日時認識する（STGのバグでAugがAvgになっているものも変換する）
+    with PERF.stage('date', len(df)) as rec:
+        df['date'] = parse_stg_dates(df['date'])
+        rec['rows_out'] = len(df)
+    # uptimeが0の行は読み取り失敗のため削除する
+    with PERF.stage('filter', len(df)) as rec:
+        df.drop(df.query('uptime == 0').index, inplace=True)
+        rec['rows_out'] = len(df)
+    for column in ['uptime', 'recv', 'send']:
+        df[column] = compact_counter(df[column])
+
+
+def stg_interval(delta_time: np.ndarray) -> float:
+    """取得間隔の中央値（先頭STG_INTERVAL_ROWS行の正常な取得間隔から求める）
+    """
+    delta = delta_time[np.isfinite(delta_time) & (delta_time > 0)][:STG_INTERVAL_ROWS]
+    return float(np.median(delta)) if len(delta) else np.nan
+
+
+def repair_stg_counters(uptime: np.ndarray, recv: np.ndarray, send: np.ndarray, delta_time: np.ndarray,
+                        prev_uptime: int = None, interval: float = None, prev_rates: tuple = None,
+                        final: bool = True) -> tuple:
+    """機器の再起動、取得間隔の異常、負の値のサンプルを検出し、カウンタ値（byte）を補正する
+        配列全体に対するNumPyの演算だけで判定と補正を行う。
+        - 再起動: uptimeが前の行より小さい（カウンタがリセットされ、値が信用できない）
+        - 異常な間隔: 取得間隔が0以下、または中央値の1/STG_GAP_FACTOR以下（スループットが極端に大きくなる）
+        - 負の値: カウンタ値が負
+        - 欠測: 取得間隔が中央値のSTG_GAP_FACTOR倍を超える（間隔全体の平均値として扱い、補正はしない）
+        再起動、異常な間隔、負の値のサンプルは、前後の正常なサンプルのスループットを線形補間した値に置き換える。
+        スループットが大きいだけのサンプルは実際のバーストの可能性があるため補正しない。
+        分割して読み込む場合は、直前の正常なサンプルのスループット（prev_rates）から補間し、
+        final=Falseなら最後の正常なサンプルより後の行は補正せずに次の分割に回す（分割の大きさによらず同じ結果になる）。
+
+    Args:
+        uptime (np.ndarray): uptime
+        recv (np.ndarray): 受信のカウンタ値（byte）
+        send (np.ndarray): 送信のカウンタ値（byte）
+        delta_time (np.ndarray): 取得間隔（秒）
+        prev_uptime (int): 直前の行のuptime（追記分・分割読込の場合）
+        interval (float): 取得間隔の中央値（Noneならdelta_timeから求める）
+        prev_rates (tuple): 直前の正常なサンプルの受信・送信のスループット（追記分・分割読込の場合）
+        final (bool): 最後の分割か（Falseなら最後の正常なサンプルまでを補正する）
+
+    Returns:
+        tuple: (補正後の受信のカウンタ値, 補正後の送信のカウンタ値, 補正の情報のdict)
+            final=Falseの場合、カウンタ値は先頭から info['rows'] 行分
+    """
+    delta = delta_time.astype(np.float64)
+    counters = [recv.astype(np.float64), send.astype(np.float64)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = [counter * 8 / delta for counter in counters]
+    valid = np.isfinite(delta) & (delta > 0)
+    if interval is None:
+        interval = stg_interval(delta)
+
+    # 再起動：uptimeが前の行より小さい
+    first = uptime[:1] if prev_uptime is None else [prev_uptime]
+    restart = np.diff(uptime.astype(np.int64), prepend=first) < 0
+    # 異常な間隔：取得間隔が0以下、または極端に短い
+    short = ~np.isnan(delta) & ((delta <= 0) | (delta <= interval / STG_GAP_FACTOR))
+    # 負の値
+    negative = valid & ((counters[0] < 0) | (counters[1] < 0))
+    # 欠測：取得間隔が極端に長い
+    gap = delta > interval * STG_GAP_FACTOR
+
+    bad = restart | short | negative
+    good = valid & ~bad
+    good_pos = np.flatnonzero(good)
+    # 最後の分割でなければ、最後の正常なサンプルまでを補正する（以降の行は次の正常なサンプルがないと補間できない）
+    rows = len(delta) if final else (int(good_pos[-1]) + 1 if len(good_pos) else 0)
+    info = {
+        'rows': rows,
+        'restart': int(restart[:rows].sum()),
+        'short': int(short[:rows].sum()),
+        'negative': int((negative & ~restart & ~short)[:rows].sum()),
+        'gap': int(gap[:rows].sum()),
+        'interval': interval,
+        'last_uptime': int(uptime[rows - 1]) if rows else prev_uptime,
+        'last_rates': tuple(float(rate[good_pos[-1]]) for rate in rates) if len(good_pos) else prev_rates,
+    }
+
+    # 前後の正常なサンプルのスループットを線形補間して、カウンタ値に戻す
+    #   直前の分割の正常なサンプルは位置-1にあるものとして補間する
+    counters = [counter[:rows] for counter in counters]
+    pos = np.flatnonzero(bad[:rows])
+    if len(pos) and (len(good_pos) or prev_rates is not None):
+        for i, (counter, rate) in enumerate(zip(counters, rates)):
+            xp, fp = good_pos, rate[good_pos]
+            if prev_rates is not None:
+                xp, fp = np.r_[-1, xp], np.r_[prev_rates[i], fp]
+            counter[pos] = np.rint(np.interp(pos, xp, fp) * np.nan_to_num(delta[pos]) / 8)
+            counter[pos] = np.maximum(counter[pos], 0)
+    return counters[0], counters[1], info
+
+
+@PERF.timed('repair')
+def repair_stg_frame(df: pd.DataFrame, prev_uptime: int = None, interval: float = None,
+                     prev_rates: tuple = None) -> dict:
+    """delta_timeを計算したDataFrameのカウンタ値を補正し、uptimeの列を削除する（inplace）
+        （repair_stg_counters参照）
+
+    Returns:
+        dict: 補正の情報
+    """
+    recv, send, info = repair_stg_counters(
+        df['uptime'].to_numpy(), df['recv'].to_numpy(), df['send'].to_numpy(), df['delta_time'].to_numpy(),
+        prev_uptime, interval, prev_rates,
+    )
+    if info['restart'] or info['short'] or info['negative']:
+        df['recv'] = compact_counter(pd.Series(recv.astype(np.int64), index=df.index))
+        df['send'] = compact_counter(pd.Series(send.astype(np.int64), index=df.index))
+    df.drop('uptime', axis=1, inplace=True)
+    return info
+
+
+def read_stg_tail(filename: str, offset: int) -> tuple:
+    """追記中のSTGのCSVファイルから、offset（byte）以降に追記された行を読み込む
+        書き込み途中の最終行は読み込まず、次回に読み込む。
+        ファイルがoffsetより小さくなっていれば（ローテーションされた場合）先頭から読み込む。
+
+    Args:
+        filename (str): CSVファイル名
+        offset (int): 前回読み込んだ位置
+
+    Returns:
+        tuple: (追記された行のDataFrame, 次回読み込む位置)
+    """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < offset:
+            offset = 0
+        skiprows = 0
+        if offset == 0:
+            skiprows = 2    # 先頭から読む場合はヘッダーの2行を読み飛ばす
+        else:
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':     # 行の途中の場合は次の行から読み込む
+                f.readline()
+        start = f.tell()
+        data = f.read(size - start)
+    # 書き込み途中の最終行を除く
+    data = data[:data.rfind(b'\n') + 1]
+    offset = start + len(data)
+
+    df = pd.read_csv(
+        io.BytesIO(data),
+        encoding='SHIFT-JIS',
+        header=None,
+        skiprows=skiprows,
+        names=['date', 'uptime', 'recv', 'send'],
+    ) if data else pd.DataFrame(columns=['date', 'uptime', 'recv', 'send'])
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'recv', 'send']), offset
+    clean_stg_frame(df)
+    return df, offset
+
+
+def append_stg_tail(filename: str, offset: int, df: pd.DataFrame, buffer, cache, repair: dict = None,
+                    progress=None, cancel=None) -> tuple:
+    """追記中のCSVファイルの追記分を読み込み、読込済みのデータ（FrameBuffer）とResampleCacheに追加する（追従モード）
+        読込済みのデータはコピーせず、処理時間は追記分の行数だけで決まる。
+
+    Args:
+        filename (str): CSVファイル名
+        offset (int): 前回読み込んだ位置
+        df (pd.DataFrame): 読込済みのDataFrame
+        buffer (FrameBuffer): dfのFrameBuffer（Noneなら作成する）
+        cache (ResampleCache): dfのリサンプル結果のキャッシュ
+        repair (dict): 読込時のカウンタ値の補正の情報（空なら補正しない）
+        progress (callable): 進捗の出力先（使用しない）
+        cancel (callable): 中止の確認（使用しない）
+
+    Returns:
+        tuple: (追加後のDataFrame, 追加した行のDataFrame, 次回読み込む位置, FrameBuffer)
+    """
+    tail, offset = read_stg_tail(filename, offset)
+    # 読込済みの日時より新しい行だけを、日時順に追加する
+    last = df.index[-1]
+    tail = tail[tail['date'] > last].drop_duplicates().set_index('date').sort_index()
+    if tail.empty:
+        return df, tail, offset, buffer
+    # delta_timeは追加した行だけ計算する（1行目は読込済みの最終行との差）
+    dates = np.concatenate([[last.to_datetime64()], tail.index.to_numpy()])
+    tail['delta_time'] = (np.diff(dates) / np.timedelta64(1, 's')).astype(np.float32)
+    # 読込済みのデータと同じ基準でカウンタ値を補正する（読込時に補正しなかった場合は補正しない）
+    if repair:
+        tail.attrs['repair'] = repair_stg_frame(
+            tail, repair.get('last_uptime'), repair.get('interval'), repair.get('last_rates')
+        )
+    else:
+        tail = tail.drop('uptime', axis=1)
+
+    if buffer is None or buffer.frame is not df:
+        buffer = FrameBuffer(df)
+    buffer.append(tail)
+    cache.update(buffer.frame, tail.index[0])
+    return buffer.frame, tail, offset, buffer
+
+
+class StgFileError(Exception):
+    """STGのCSVファイルのエラー
+    """
+    def __init__(self, title: str, message: str, filename: str):
+        super().__init__(message)
+        self.title = title          # エラーの種類（メッセージボックスのタイトル）
+        self.message = message      # エラーメッセージ
+        self.filename = filename
+
+
+class StgLoadError(Exception):
+    """複数のSTGのCSVファイルの読込エラー
+        最初のエラーで中断せず、すべてのファイルのエラー（StgFileError）をまとめて報告する
+    """
+    def __init__(self, errors: list):
+        super().__init__('\n'.join(f'{err.title}: {err.filename}' for err in errors))
+        self.errors = errors
+
+
+class StgFile():
+    """STGのCSVファイル
+        ファイルを1回だけ開き、同じファイルハンドルで1行目（STGのヘッダー行）のチェックと
+        データ行の読込を行う。（ネットワーク共有上のファイルでも開くのは1回）
+    """
+    def __init__(self, filename: str):
+        """ファイルを開いて1行目をチェックする
+
+        Raises:
+            StgFileError: ファイルが開けない、STGのCSVファイルではない
+        """
+        self.filename = filename
+        try:
+            self.f = open(filename, 'rb')
+        except Exception as err:
+            raise StgFileError('ファイルオープンエラー', f'ファイルが開けません\n{filename}\n{err}', filename)
+        try:
+            with PERF.stage('header'):
+                self._read_header()
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_header(self):
+        filename = self.filename
+        try:
+            line = self.f.readline()
+            self.f.readline()   # 列名の行を読み飛ばす
+        except Exception as err:
+            raise StgFileError('ファイルオープンエラー', f'ファイルが開けません\n{filename}\n{err}', filename)
+        self.data_start = self.f.tell()     # データ行の開始位置
+        try:
+            line = line.decode('utf-8').rstrip()
+        except UnicodeDecodeError as err:
+            raise StgFileError('文字コードエラー', f'文字コードがUTF-8ではありません\n{filename}\n{err}', filename)
+
+        # STGのファイルであることのチェック
+        #   行頭がSTGでカンマ区切りで5カラムあること
+        columns = line.split(',')
+        if line.startswith('STG') is False or len(columns) != 5:
+            raise StgFileError('ファイルフォーマットエラー', f'STGのCSVファイルではありません\n{filename}', filename)
+        # ターゲットアドレスを取得
+        m = re.match('Target Address:(.+)', columns[1])
+        if not m:
+            raise StgFileError('ファイルフォーマットエラー', f'STGのCSVファイルではありません\n{filename}', filename)
+        self.header = line              # 1行目の文字列
+        self.target = columns[1:]       # 対象の情報
+        self.target_ip = m.group(1)     # ターゲットアドレス
+
+    def read(self, chunksize: int = None):
+        """データ行を読み込む（chunksizeを指定した場合はchunksize行ずつ読み込むイテレータを返す）
+        """
+        self.f.seek(self.data_start)
+        return pd.read_csv(
+            self.f,
+            encoding='SHIFT-JIS',                       # 文字コードを指定
+            header=None,                                # ヘッダーの2行は読込済み
+            names=['date', 'uptime', 'recv', 'send'],   # カラム名を設定
+            chunksize=chunksize,
+        )
+
+    def first_date(self):
+        """最初のデータ行の日時を返す（データ行がなければNone）
+        """
+        self.f.seek(self.data_start)
+        line = self.f.readline().decode('SHIFT-JIS')
+        if not line.strip():
+            return None
+        return parse_stg_dates(pd.Series([line.split(',')[0]]))[0]
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_stg_file(filename: str, cache=None) -> tuple:
+    """STGのCSVファイルを1つ読み込む
+        1行目のチェック、日時の変換とuptimeが0の行の削除までをファイル単位で行う
+        cacheを指定した場合、キャッシュがあればデータ行を読まずにキャッシュから読み込む
+
+    Args:
+        filename (str): CSVファイル名
+        cache (StgCache): キャッシュ
+
+    Raises:
+        StgFileError: ファイルが開けない、STGのCSVファイルではない
+
+    Returns:
+        tuple: (DataFrame, 読込時間[sec], キャッシュから読み込んだか, StgFile)
+    """
+    t = ExecTime()
+    with StgFile(filename) as stg:
+        if cache is not None:
+            df = cache.get(filename, stg.header)
+            if df is not None:
+                return df, t.laptime, True, stg
+        with PERF.stage('parse') as rec:
+            df = stg.read()
+            rec['rows_out'] = len(df)
+    clean_stg_frame(df)
+
+    if cache is not None:
+        cache.put(filename, stg.header, df)
+    return df, t.laptime, False, stg
+
+
+def check_stg_targets(files: list, errors: list) -> list:
+    """すべてのファイルが同じ対象の情報であることをチェックする
+        一致しないファイルはerrorsに追加する（先頭のファイルを基準とする）
+
+    Args:
+        files (list): StgFileのリスト（エラーのファイルはNone）
+        errors (list): StgFileErrorのリスト
+
+    Returns:
+        list: 先頭のファイルの対象の情報
+    """
+    files = [stg for stg in files if stg is not None]
+    if not files:
+        return None
+    target = files[0].target
+    for stg in files[1:]:
+        if stg.target != target:
+            errors.append(StgFileError(
+                'ファイル指定エラー', f'{os.path.basename(stg.filename)} の対象情報が一致しません', stg.filename
+            ))
+    return target
+
+
+class StgCache():
+    """読込済みCSVファイルのキャッシュ
+        読込・整形済みのDataFrameをファイル単位に列指向のバイナリ形式で保存する。
+        （pyarrowがあればFeather形式、なければNumPyのnpz形式）
+        ファイルのパス、サイズ、更新日時、STGのヘッダー行をキーとするため、
+        追記中のCSVファイルが更新されると別のキーになり再読込される。
+        容量の上限を超えたら、最後に使用した日時が古いものから削除する。
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ext = '.feather' if pyarrow is not None else '.npz'
+        self.lock = threading.Lock()
+
+    def _path(self, filename: str, header: str) -> str:
+        """キャッシュファイルのパスを返す
+        """
+        st = os.stat(filename)
+        key = '\0'.join([
+            str(CACHE_VERSION), os.path.abspath(filename), str(st.st_size), str(st.st_mtime_ns), header or '',
+        ])
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + self.ext)
+
+    def get(self, filename: str, header: str):
+        """キャッシュを読み込む。キャッシュがなければNoneを返す
+        """
+        path = self._path(filename, header)
+        try:
+            if self.ext == '.feather':
+                df = pd.read_feather(path)
+            else:
+                with np.load(path) as npz:
+                    df = pd.DataFrame({k: npz[k] for k in npz.files})
+        except Exception:
+            return None
+        # 最後に使用した日時を更新する（LRUの判定に使用）
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, filename: str, header: str, df: pd.DataFrame):
+        """キャッシュを保存し、上限を超えていれば古いものから削除する
+        """
+        path = self._path(filename, header)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.ext == '.feather':
+                df.reset_index(drop=True).to_feather(tmp)
+            else:
+                with open(tmp, 'wb') as f:
+                    np.savez(f, **{c: df[c].to_numpy() for c in df.columns})
+            os.replace(tmp, path)
+        except Exception:
+            # キャッシュの保存に失敗しても読込は継続する
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def _entries(self) -> list:
+        """キャッシュファイルの一覧（パス、サイズ、最終使用日時）を返す
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(self.ext):
+                st = entry.stat()
+                entries.append((entry.path, st.st_size, st.st_mtime))
+        return entries
+
+    def evict(self):
+        """容量の上限を超えていたら、最後に使用した日時が古いものから削除する
+        """
+        with self.lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(e[1] for e in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self) -> int:
+        """キャッシュをすべて削除し、削除したファイル数を返す
+        """
+        with self.lock:
+            count = 0
+            for path, *_ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                count += 1
+            return count
+
+    @property
+    def size(self) -> int:
+        """キャッシュの合計サイズ（byte）
+        """
+        return sum(e[1] for e in self._entries())
+
+
+class StgStore():
+    """ターゲットごとの長期間の履歴のストア（追記のみ）
+        読み込んだDataFrame（カウンタ値の補正済み）を日ごとに分割し、
+        STORE_DIR/ターゲット/YYYY-MM-DD.npy に日時順の構造化配列（STORE_DTYPE）として保存する。
+        読込はメモリマップで行い、指定期間の日のファイルだけを開くので、
+        保存した期間の長さによらず1日分の読込は一瞬で終わる。
+        日時が保存済みの行は追加しない。日の先頭のdelta_timeが欠けていれば、前日の最後の行との差で補う。
+    """
+    def __init__(self, store_dir: str = STORE_DIR):
+        self.store_dir = store_dir
+        self.lock = threading.Lock()
+        self.versions = {}      # ターゲットごとの追加回数（queryの結果の再利用の判定に使用）
+        self.last = {}          # ターゲットごとの直前のqueryの (期間, 追加回数, DataFrame)
+
+    def _dir(self, target_ip: str) -> str:
+        return os.path.join(self.store_dir, re.sub(r'[^\w.-]', '_', target_ip))
+
+    def targets(self) -> dict:
+        """保存済みのターゲットアドレスと対象の情報のdictを返す
+        """
+        targets = {}
+        if not os.path.isdir(self.store_dir):
+            return targets
+        for entry in sorted(os.scandir(self.store_dir), key=lambda e: e.name):
+            try:
+                with open(os.path.join(entry.path, 'target.json'), encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            targets[meta['target_ip']] = meta['target']
+        return targets
+
+    def days(self, target_ip: str) -> list:
+        """保存済みの日付（YYYY-MM-DD）のリストを返す
+        """
+        try:
+            names = os.listdir(self._dir(target_ip))
+        except OSError:
+            return []
+        return sorted(name[:-4] for name in names if re.fullmatch(r'\d{4}-\d{2}-\d{2}\.npy', name))
+
+    def append(self, target_ip: str, target: list, df: pd.DataFrame, progress=None, cancel=None) -> int:
+        """load_stg_filesで読み込んだDataFrameの行を追加し、追加した行数を返す
+            行がある日のファイルだけを読み書きする
+
+        Args:
+            target_ip (str): ターゲットアドレス
+            target (list): 対象の情報
+            df (pd.DataFrame): load_stg_filesで読み込んだDataFrame
+            progress (callable): 進捗の出力先 progress(メッセージ, 処理済み数, 全体数)
+            cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+        """
+        progress = progress or (lambda text, done=None, total=None: None)
+        cancel = cancel or (lambda: None)
+        if df.empty:
+            return 0
+        path = self._dir(target_ip)
+        rows = np.empty(len(df), dtype=STORE_DTYPE)
+        rows['date'] = df.index.asi8
+        rows['recv'] = df['recv'].to_numpy()
+        rows['send'] = df['send'].to_numpy()
+        rows['delta_time'] = df['delta_time'].to_numpy()
+        # 日の境界で分割する
+        day = rows['date'] // (24 * 3600 * 10**9)
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(day)) + 1, [len(rows)]])
+
+        added = 0
+        with self.lock:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, 'target.json'), 'w', encoding='utf-8') as f:
+                json.dump({'target_ip': target_ip, 'target': list(target)}, f, ensure_ascii=False)
+            days = self.days(target_ip)
+            for count, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+                name = str(pd.Timestamp(rows['date'][start]).date())
+                added += self._append_day(path, name, rows[start:stop], days)
+                progress('', count + 1, len(bounds) - 1)
+                cancel()
+            self.versions[target_ip] = self.versions.get(target_ip, 0) + 1
+        return added
+
+    def _append_day(self, path: str, name: str, rows: np.ndarray, days: list) -> int:
+        """1日分の行を追加する
+        """
+        filename = os.path.join(path, f'{name}.npy')
+        if name in days:
+            stored = np.load(filename)
+            rows = rows[~np.isin(rows['date'], stored['date'])]
+            if not len(rows):
+                return 0
+            merged = np.concatenate([stored, rows])
+            merged = merged[np.argsort(merged['date'], kind='stable')]
+        else:
+            merged = rows.copy()
+            days.insert(int(np.searchsorted(days, name)), name)
+        # 欠けているdelta_time（読込ごとの先頭の行）を、直前の行との差で補う
+        missing = np.flatnonzero(np.isnan(merged['delta_time']))
+        if len(missing):
+            prev = np.empty(len(merged), dtype=np.int64)
+            prev[1:] = merged['date'][:-1]
+            prev[0] = self._last_date(path, days, name)
+            delta = (merged['date'][missing] - prev[missing]) / 1e9
+            merged['delta_time'][missing] = np.where(prev[missing] > 0, delta, np.nan)
+        tmp = f'{filename}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, merged)
+        os.replace(tmp, filename)
+        return len(rows)
+
+    def _last_date(self, path: str, days: list, name: str) -> int:
+        """nameの前日以前で最後の行の日時（なければ0）
+        """
+        idx = days.index(name)
+        if idx == 0:
+            return 0
+        stored = np.load(os.path.join(path, f'{days[idx - 1]}.npy'), mmap_mode='r')
+        return int(stored['date'][-1]) if len(stored) else 0
+
+    def query(self, target_ip: str, date_from: str = None, date_to: str = None) -> pd.DataFrame:
+        """指定期間（日付、両端を含む）の行をload_stg_filesと同じ形式のDataFrameで返す
+            期間の日のファイルだけをメモリマップで開く。
+            直前と同じ期間で追加がなければ同じDataFrameを返す（ResampleCacheを使えるように）
+        """
+        key = (date_from, date_to, self.versions.get(target_ip, 0))
+        last = self.last.get(target_ip)
+        if last is not None and last[0] == key:
+            return last[1]
+        days = self.days(target_ip)
+        lo = 0 if not date_from else np.searchsorted(days, date_from, side='left')
+        hi = len(days) if not date_to else np.searchsorted(days, date_to, side='right')
+        path = self._dir(target_ip)
+        parts = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in days[lo:hi]]
+        # メモリマップは開いたままにしない（追加時にファイルを置き換えられるように）
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=STORE_DTYPE)
+        df = pd.DataFrame(
+            {'recv': rows['recv'], 'send': rows['send'], 'delta_time': rows['delta_time']},
+            index=pd.DatetimeIndex(rows['date'].view('datetime64[ns]'), name='date'),
+            copy=False,
+        )
+        self.last[target_ip] = (key, df)
+        return df
+
+
+def decimate_m4(x: np.ndarray, ys: list, width: int) -> np.ndarray:
+    """M4法で間引いたときに残す行番号を返す
+        xを等間隔にwidth個の区間（画面の1ピクセル分）に分け、区間ごとに
+        最初・最後の行と、ysの各系列の最小・最大の行を残す。
+        区間内の最大値（トラフィックのスパイク）は必ず残るため、
+        ピクセル幅で描画したときの形状は間引く前と変わらない。
+
+    Args:
+        x (np.ndarray): 昇順の横軸の値（日時はint64）
+        ys (list): 縦軸の値の配列のリスト
+        width (int): 区間の数（描画領域のピクセル幅）
+
+    Returns:
+        np.ndarray: 残す行番号（昇順）
+    """
+    n = len(x)
+    if width < 1 or n <= 4 * width:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    edges = np.linspace(x[0], x[-1], width + 1)
+    bins = (np.searchsorted(edges, x, side='right') - 1).clip(0, width - 1)
+    # 空でない区間の先頭・末尾の行
+    starts = np.flatnonzero(np.diff(bins, prepend=-1))
+    ends = np.append(starts[1:] - 1, n - 1)
+    keep = [starts, ends]
+    for y in ys:
+        y = np.asarray(y, dtype=np.float64)
+        for reduce in (np.fmin, np.fmax):
+            # 区間の最小（最大）値と一致する行のうち、区間で最初の行
+            value = reduce.reduceat(y, starts)
+            hit = np.flatnonzero(y == np.repeat(value, np.diff(np.append(starts, n))))
+            _, first = np.unique(bins[hit], return_index=True)
+            keep.append(hit[first])
+    return np.unique(np.concatenate(keep))
+
+
+def aggregate_stg(df: pd.DataFrame, rule: str, start: pd.Timestamp = None) -> pd.DataFrame:
+    """日時順のDataFrameを集計単位ごとに集計する（df.resample(rule)と同じ集計区間）
+        recv、send、delta_timeは合計値、countはサンプル数、*_min・*_maxはサンプルのスループット（bps）の
+        最小値・最大値とする。dfが集計済み（countの列がある）なら、集計値をさらに集計する。
+        合計値は累積和の差で、最小値・最大値は集計区間の先頭位置でのreduceatで求める。
+        データのない集計区間も含める（合計値は0、最小値・最大値はNaN）。
+
+    Args:
+        df (pd.DataFrame): 元のDataFrame、または aggregate_stg の結果
+        rule (str): 集計単位（MEAN_TIMESの値、'org'は不可）
+        start (pd.Timestamp): 最初の集計区間（dfの先頭より前ならデータのない集計区間から始める）
+
+    Returns:
+        pd.DataFrame: 集計区間の開始日時をインデックスとするDataFrame
+    """
+    step = to_offset(rule).nanos
+    columns = ['recv', 'send', 'delta_time', 'count', 'recv_min', 'recv_max', 'send_min', 'send_max']
+    if df.empty:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name=df.index.name))
+
+    # 集計対象の値（元のDataFrameの場合は、サンプルごとのスループットを最小値・最大値とする）
+    delta = df['delta_time'].to_numpy(dtype=np.float64)
+    sums = [df['recv'].to_numpy(dtype=np.int64), df['send'].to_numpy(dtype=np.int64), np.nan_to_num(delta)]
+    if 'count' in df:
+        sums.append(df['count'].to_numpy(dtype=np.int64))
+        extremes = [df[c].to_numpy(dtype=np.float64) for c in columns[4:]]
+    else:
+        sums.append(np.ones(len(df), dtype=np.int64))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = [sums[i] * 8 / delta for i in range(2)]
+        extremes = [rates[0], rates[0], rates[1], rates[1]]
+
+    # 集計区間ごとの先頭位置
+    keys = df.index.asi8 // step
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    first = keys[0] if start is None else min(keys[0], start.value // step)
+    pos = keys[starts] - first
+    size = keys[-1] - first + 1
+
+    data = {}
+    for column, values in zip(columns[:4], sums):
+        csum = np.r_[0, np.cumsum(values)]
+        out = np.zeros(size, dtype=values.dtype)
+        out[pos] = csum[ends] - csum[starts]
+        data[column] = out
+    for column, values, ufunc in zip(columns[4:], extremes, [np.fmin, np.fmax, np.fmin, np.fmax]):
+        out = np.full(size, np.nan)
+        out[pos] = ufunc.reduceat(values, starts)
+        data[column] = out
+    index = pd.DatetimeIndex((np.arange(size) + first) * step, name=df.index.name)
+    return pd.DataFrame(data, index=index)
+
+
+class FrameBuffer():
+    """行を追加できるDataFrame（追従モードで使用する）
+        列ごとに容量に余裕を持たせたNumPy配列に書き込み、frameは書込済みの行のビューのDataFrameとする。
+        容量が足りなければ1.5倍に拡張するので、行を追加するコストは（償却すると）追加した行数だけで決まる
+        （pd.concatのように全体をコピーしない）。set_tailで書込済みの行を置き換えると、以前のframeの行も変わる。
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.name = df.index.name
+        self.size = len(df)
+        capacity = self.size + max(self.size // 2, 1)
+        self.index = np.empty(capacity, dtype='datetime64[ns]')
+        self.index[:self.size] = df.index.to_numpy()
+        self.columns = {}
+        for column in df.columns:
+            self.columns[column] = np.empty(capacity, dtype=df[column].dtype)
+            self.columns[column][:self.size] = df[column].to_numpy()
+        self.frame = df
+
+    def append(self, df: pd.DataFrame):
+        self.set_tail(self.size, df)
+
+    def set_tail(self, pos: int, df: pd.DataFrame):
+        """pos行目以降をdfの行に置き換える（列はframeと同じであること）
+        """
+        size = pos + len(df)
+        dtypes = {column: np.promote_types(values.dtype, df[column].dtype) for column, values in self.columns.items()}
+        if size > len(self.index) or any(dtypes[c] != v.dtype for c, v in self.columns.items()):
+            # 容量を拡張する（値が収まらない場合は型も変える）
+            capacity = max(size, len(self.index) * 3 // 2)
+            index = np.empty(capacity, dtype='datetime64[ns]')
+            index[:pos] = self.index[:pos]
+            self.index = index
+            for column, values in self.columns.items():
+                self.columns[column] = np.empty(capacity, dtype=dtypes[column])
+                self.columns[column][:pos] = values[:pos]
+        self.index[pos:size] = df.index.to_numpy()
+        for column, values in self.columns.items():
+            values[pos:size] = df[column].to_numpy()
+        self.size = size
+        self.frame = pd.DataFrame(
+            {column: values[:size] for column, values in self.columns.items()},
+            index=pd.DatetimeIndex(self.index[:size], name=self.name),
+            copy=False,
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def rule_nanos(rule: str) -> int:
+    """集計単位の時間（ナノ秒）（to_offsetは遅いので、追従モードで繰り返し使う場合のために結果を再利用する）
+    """
+    return to_offset(rule).nanos
+
+
+class ResampleCache():
+    """集計単位ごとのリサンプル結果（合計値）のキャッシュ
+        元のDataFrameが変わったら（同じ読込の系列のDataFrameでなくなったら）キャッシュを破棄する。
+        追従モードで行を追加したときは update で追加した行を含む集計区間以降だけを再集計し、世代を進める。
+        行を追加する前のDataFrame（実行中のバックグラウンド処理が使用中のもの）も同じ系列として扱い、
+        キャッシュは破棄せずに最新の世代の集計結果を返す。
+        集計単位の時間が割り切れる細かい集計単位のキャッシュがあれば、
+        元のDataFrameではなくそのキャッシュから集計する。（例：1分平均 → 1時間平均）
+        MEAN_TIMESの集計単位はいずれも1日を割り切るので、集計区間の境界は一致する。
+        読込後に build で全集計単位を細かい順に集計しておく（集計単位のピラミッド）と、
+        プレビュー・グラフ表示・出力は元データの大きさによらず集計済みのデータから行える。
+        各集計単位は、合計値、サンプル数、スループットの最小値・最大値を持つ（aggregate_stg参照）。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()    # バックグラウンド処理から使用するため
+        self._reset(None)
+
+    def _reset(self, df: pd.DataFrame):
+        self.df = df            # 最新の世代の元のDataFrame
+        self.frames = {}        # 同じ系列の元のDataFrame（行を追加する前のものを含む）のid → weakref
+        self.generation = 0     # updateで行を追加した回数
+        self.cache = {}
+        self.buffers = {}       # updateで末尾を更新する集計単位ごとのFrameBuffer
+        if df is not None:
+            self._register(df)
+
+    def _register(self, df: pd.DataFrame):
+        self.frames = {key: ref for key, ref in self.frames.items() if ref() is not None}
+        self.frames[id(df)] = weakref.ref(df)
+
+    def _known(self, df: pd.DataFrame) -> bool:
+        ref = self.frames.get(id(df))
+        return ref is not None and ref() is df
+
+    def clear(self):
+        with self.lock:
+            self._reset(None)
+
+    def get(self, df: pd.DataFrame, rule: str) -> pd.DataFrame:
+        """dfをruleでリサンプルした合計値を返す（キャッシュしたDataFrameをそのまま返すので変更しないこと）
+
+        Args:
+            df (pd.DataFrame): 元のDataFrame
+            rule (str): 集計単位（MEAN_TIMESの値）
+
+        Returns:
+            pd.DataFrame: リサンプルしたDataFrame
+        """
+        with self.lock:
+            if not self._known(df):
+                self._reset(df)
+            if rule not in self.cache:
+                self.cache[rule] = aggregate_stg(self._source(rule), rule)
+            return self.cache[rule]
+
+    def cached(self, df: pd.DataFrame, rule: str) -> pd.DataFrame:
+        """dfをruleで集計済みならその結果を、未集計ならNoneを返す（集計はしない）
+        """
+        with self.lock:
+            return self.cache.get(rule) if self._known(df) else None
+
+    def build(self, df: pd.DataFrame, base_rule: str = None, progress=None, cancel=None):
+        """MEAN_TIMESのすべての集計単位を細かい順に集計する（前の集計単位の結果から集計する）
+
+        Args:
+            df (pd.DataFrame): 元のDataFrame
+            base_rule (str): dfが集計済み（ストリーミング集計）の場合、その集計単位
+            progress (callable): 進捗の出力先 progress(メッセージ, 処理済み数, 全体数)
+            cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+        """
+        progress = progress or (lambda text, done=None, total=None: None)
+        cancel = cancel or (lambda: None)
+        rules = sorted((rule for rule in MEAN_TIMES.values() if rule != 'org'), key=rule_nanos)
+        if base_rule is not None:
+            base = rule_nanos(base_rule)
+            rules = [r for r in rules if rule_nanos(r) > base and rule_nanos(r) % base == 0]
+        for count, rule in enumerate(rules):
+            self.get(df, rule)
+            progress('', count + 1, len(rules))
+            cancel()
+
+    def _source(self, rule: str) -> pd.DataFrame:
+        """ruleの集計に使用できる最も粗いキャッシュ、なければ元のDataFrameを返す
+        """
+        nanos = rule_nanos(rule)
+        candidates = [
+            (rule_nanos(r), r) for r in self.cache
+            if rule_nanos(r) < nanos and nanos % rule_nanos(r) == 0
+        ]
+        if not candidates:
+            return self.df
+        return self.cache[max(candidates)[1]]
+
+    def update(self, df: pd.DataFrame, start: pd.Timestamp):
+        """元のDataFrameに行が追加されたとき、キャッシュを追加分だけ更新して世代を進める
+            dfは、元のDataFrameのstart以降に行を追加したもの。
+            集計単位ごとに、追加した行を含む集計区間以降だけを再集計してFrameBufferの末尾を置き換える。
+
+        Args:
+            df (pd.DataFrame): 行を追加したDataFrame
+            start (Timestamp): 追加した行の最初の日時
+        """
+        with self.lock:
+            if self.df is None:
+                self._reset(df)
+                return
+            self._register(df)
+            self.df = df
+            self.generation += 1
+            for rule, cached in sorted(self.cache.items(), key=lambda item: rule_nanos(item[0])):
+                if cached.empty:
+                    self.cache[rule] = aggregate_stg(self._source(rule), rule)
+                    continue
+                # 追加した行を含む集計区間（前回の最後の集計区間の次より後なら、次の集計区間）から再集計する
+                #   （ラベルでのスライスはインデックスの順序の確認で全体を走査するため、二分探索で位置を求める）
+                bucket = min(start.floor(rule), cached.index[-1] + pd.Timedelta(rule_nanos(rule)))
+                source = self._source(rule)
+                tail = aggregate_stg(source.iloc[np.searchsorted(source.index.asi8, bucket.value):], rule, bucket)
+                if rule not in self.buffers:
+                    self.buffers[rule] = FrameBuffer(cached)
+                buffer = self.buffers[rule]
+                buffer.set_tail(np.searchsorted(cached.index.asi8, bucket.value), tail)
+                self.cache[rule] = buffer.frame
+
+
+def merge_stg_frames(dfs: list):
+    """日時順に並んだファイルごとのDataFrameをマージする
+        ローテーションしたファイルはそれぞれ日時順に並んでいるので、全体のソートと重複行の削除の代わりに
+        最初の日時の順にファイルをつなぎ、前のファイルと重なる先頭部分（重複行）を取り除く。
+        ファイル内の日時が昇順でない場合や、重なる部分が前のファイルの行と一致しない場合はNoneを返す。
+        （呼出し側で drop_duplicates + sort_index による従来の処理を行う）
+
+    Args:
+        dfs (list): clean_stg_frameを行ったDataFrameのリスト（'date'列を持つ）
+
+    Returns:
+        pd.DataFrame: 日時順で日時に重複のないDataFrame（マージできない場合はNone）
+    """
+    runs = []
+    for df in dfs:
+        if df.empty:
+            continue
+        dates = df['date'].to_numpy().view(np.int64)
+        # ファイル内で日時が単調増加（重複なし）であることを確認する
+        if not (dates[1:] > dates[:-1]).all():
+            return None
+        runs.append((dates[0], dates, df))
+    if not runs:
+        return None
+    runs.sort(key=lambda run: run[0])
+
+    pieces = []         # (日時, DataFrame) マージ済みの部分
+    last = None         # マージ済みの最終日時
+    for first, dates, df in runs:
+        if last is not None and first <= last:
+            # 前のファイルと重なる部分は、マージ済みの行と完全に一致すること
+            k = np.searchsorted(dates, last, side='right')
+            if not _is_merged_overlap(pieces, dates[:k], df.iloc[:k]):
+                return None
+            dates, df = dates[k:], df.iloc[k:]
+            if df.empty:
+                continue
+        pieces.append((dates, df))
+        last = dates[-1]
+    return pd.concat([df for dates, df in pieces], ignore_index=True)
+
+
+def _is_merged_overlap(pieces: list, dates: np.ndarray, df: pd.DataFrame) -> bool:
+    """重なる部分の行（日時と値）が、すべてマージ済みの行と一致するか確認する
+    """
+    # マージ済みの部分を後ろから順に確認する
+    for merged_dates, merged in reversed(pieces):
+        k = np.searchsorted(dates, merged_dates[0])     # この部分より前の日時の行数
+        pos = np.searchsorted(merged_dates, dates[k:])
+        if (pos >= len(merged_dates)).any() or (merged_dates[pos] != dates[k:]).any():
+            return False
+        for column in ('recv', 'send'):
+            if (merged[column].to_numpy()[pos] != df[column].to_numpy()[k:]).any():
+                return False
+        dates, df = dates[:k], df.iloc[:k]
+        if len(dates) == 0:
+            return True
+    return False
+
+
+def load_stg_files(filenames: list, cache=None, progress=None, cancel=None, repair: bool = True) -> tuple:
+    """複数のSTGのCSVファイルを並列に読み込み、1つのDataFrameにする
+        各ファイルは1回だけ開き、1行目のチェックとデータ行の読込を続けて行う。
+        ファイルの日時順のマージ（重複行の削除）、delta_timeの計算、カウンタ値の補正まで行う
+
+    Args:
+        filenames (list): CSVファイル名のリスト
+        cache (StgCache): キャッシュ
+        progress (callable): 進捗の出力先 progress(メッセージ, 処理済み数, 全体数)
+        cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+        repair (bool): 再起動・取得間隔の異常・負の値のカウンタ値を補正するか（repair_stg_counters参照）
+
+    Raises:
+        StgLoadError: ファイルのエラー（すべてのファイルのエラーをまとめて報告する）
+
+    Returns:
+        tuple: (日時をインデックスとするDataFrame, 対象の情報, ターゲットアドレス)
+    """
+    progress = progress or (lambda text, done=None, total=None: None)
+    cancel = cancel or (lambda: None)
+    t = ExecTime()
+
+    # CSVファイルを並列にDataFrameとして読み込み、最後に1回だけ結合する
+    dfs = [None] * len(filenames)
+    files = [None] * len(filenames)
+    errors = []
+    with ThreadPoolExecutor() as executor:
+        futures = {
+            executor.submit(read_stg_file, filename, cache): idx
+            for idx, filename in enumerate(filenames)
+        }
+        try:
+            for count, future in enumerate(as_completed(futures)):
+                idx = futures[future]
+                try:
+                    dfs[idx], laptime, cached, files[idx] = future.result()
+                except StgFileError as err:
+                    errors.append(err)
+                    text = f'Error!：{err.title}\n'
+                except Exception as err:
+                    errors.append(StgFileError(
+                        'ファイル読込エラー', f'ファイルが読み込めません\n{filenames[idx]}\n{err}', filenames[idx]
+                    ))
+                    text = 'Error!：ファイル読込エラー\n'
+                else:
+                    text = f'{laptime:.3f} sec' + ('（キャッシュ）\n' if cached else '\n')
+                progress(f' [{count+1}/{len(filenames)}] "{filenames[idx]}" ... {text}', count + 1, len(filenames))
+                cancel()
+        except BaseException:
+            # 中止の場合は未着手のファイルを読み込まない
+            for future in futures:
+                future.cancel()
+            raise
+
+    # Target情報がすべてのファイルで一致するかチェック
+    target = check_stg_targets(files, errors)
+    if errors:
+        order = {filename: idx for idx, filename in enumerate(filenames)}
+        raise StgLoadError(sorted(errors, key=lambda err: order.get(err.filename, 0)))
+    target_ip = files[0].target_ip
+
+    # 日時順に並んだファイルをマージする
+    rows = sum(len(df) for df in dfs)
+    with PERF.stage('dedup_sort', rows) as rec:
+        df = merge_stg_frames(dfs)
+        if df is not None:
+            df.set_index('date', inplace=True)
+            rec['rows_out'] = len(df)
+    if df is None:
+        # マージできない場合は、結合してから重複行の削除とソートを行う
+        #   結合順はファイルの指定順とする（逐次読込と同じ結果にするため）
+        with PERF.stage('concat', rows) as rec:
+            df = pd.concat(dfs)
+            rec['rows_out'] = len(df)
+        with PERF.stage('dedup_sort', rows) as rec:
+            # 重複行を削除する
+            df.drop_duplicates(inplace=True)
+            # 'date'をインデックスにする
+            df.set_index('date', inplace=True)
+            # インデックス順（日時）でソートする
+            df.sort_index(inplace=True)
+            rec['rows_out'] = len(df)
+    progress(f' 合計 {t.laptime:.3f} sec\n')
+
+    with PERF.stage('delta', len(df)) as rec:
+        # 1行目を削除する（取得値が非常に大きい場合があるため）
+        df.drop(df.index[0], inplace=True)
+        # delta_timeを計算する（メモリ使用量を減らすためfloat32で保持する）
+        df['delta_time'] = df.index.to_series().diff().dt.total_seconds().astype(np.float32)
+        rec['rows_out'] = len(df)
+    # 再起動・取得間隔の異常・負の値のカウンタ値を補正する
+    if repair:
+        df.attrs['repair'] = repair_stg_frame(df)
+    else:
+        df.drop('uptime', axis=1, inplace=True)
+    return df, target, target_ip
+
+
+def open_stg_files(filenames: list) -> tuple:
+    """複数のSTGのCSVファイルを並列に開き、1行目をチェックする
+
+    Raises:
+        StgLoadError: ファイルのエラー（すべてのファイルのエラーをまとめて報告する）
+
+    Returns:
+        tuple: (StgFileのリスト, 対象の情報)
+    """
+    errors = []
+    files = [None] * len(filenames)
+    with ThreadPoolExecutor() as executor:
+        futures = {executor.submit(StgFile, filename): idx for idx, filename in enumerate(filenames)}
+        for future in as_completed(futures):
+            try:
+                files[futures[future]] = future.result()
+            except StgFileError as err:
+                errors.append(err)
+    target = check_stg_targets(files, errors)
+    if errors:
+        for stg in files:
+            if stg is not None:
+                stg.close()
+        order = {filename: idx for idx, filename in enumerate(filenames)}
+        raise StgLoadError(sorted(errors, key=lambda err: order.get(err.filename, 0)))
+    return files, target
+
+
+def stream_stg_files(filenames: list, rule: str, chunk_rows: int = STREAM_CHUNK_ROWS,
+                     progress=None, cancel=None, repair: bool = True) -> tuple:
+    """複数のSTGのCSVファイルを分割して読み込みながら、集計単位ごとの合計値に集計する
+        メモリに収まらないCSVファイル用。使用メモリは元データではなく集計結果の大きさで決まる。
+        ファイルは最初の日時の順に読み込み、読込済みの最終日時以前の行
+        （ローテーションで重複した行）は読み飛ばす。
+        ファイル・分割の境界をまたぐ集計区間は、最後に合算する。
+        結果は load_stg_files で読み込んで resample(rule).sum() したものと同じになる。
+
+    Args:
+        filenames (list): CSVファイル名のリスト
+        rule (str): 集計単位（MEAN_TIMESの値、'org'は不可）
+        chunk_rows (int): 一度に読み込む行数
+        progress (callable): 進捗の出力先 progress(メッセージ, 処理済み数, 全体数)
+        cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+        repair (bool): 再起動・取得間隔の異常・負の値のカウンタ値を補正するか（repair_stg_counters参照）
+
+    Raises:
+        StgLoadError: ファイルのエラー（すべてのファイルのエラーをまとめて報告する）
+
+    Returns:
+        tuple: (集計区間の開始日時をインデックスとするDataFrame（attrs['rows']に元データの行数）,
+                対象の情報, ターゲットアドレス)
+    """
+    progress = progress or (lambda text, done=None, total=None: None)
+    cancel = cancel or (lambda: None)
+    t = ExecTime()
+
+    files, target = open_stg_files(filenames)
+    try:
+        return _stream_stg_files(files, rule, chunk_rows, progress, cancel, t, repair), target, files[0].target_ip
+    finally:
+        for stg in files:
+            stg.close()
+
+
+def _stream_stg_files(files: list, rule: str, chunk_rows: int, progress, cancel, t,
+                      repair: bool = True) -> pd.DataFrame:
+    """開いたSTGのCSVファイル（StgFileのリスト）を分割して読み込みながら集計する（stream_stg_files参照）
+    """
+    # ファイルを最初の日時の順に並べる（データ行のないファイルは除く）
+    first_dates = [(stg.first_date(), idx) for idx, stg in enumerate(files)]
+    ordered = [files[idx] for date, idx in sorted(d for d in first_dates if d[0] is not None)]
+
+    partials = []       # 分割ごとの集計結果
+    last = None         # 読込済みの最終日時
+    rows = 0
+    counts = {'restart': 0, 'short': 0, 'negative': 0, 'gap': 0}
+    # カウンタ値の補正は、取得間隔の中央値が求まる（STG_INTERVAL_ROWS行を読み込む）までと、
+    # 分割の最後の正常なサンプルより後の行を次の分割と合わせて行う（load_stg_filesと同じ結果にするため）
+    state = {'pending': None, 'interval': None, 'prev_uptime': None, 'prev_rates': None}
+
+    def aggregate(dates: pd.Series, recv: np.ndarray, send: np.ndarray, delta: np.ndarray):
+        partials.append(pd.DataFrame({
+            'recv': recv.astype(np.int64),
+            'send': send.astype(np.int64),
+            'delta_time': delta,
+        }, index=dates.index).groupby(dates.dt.floor(rule)).sum())
+
+    def repair_pending(final: bool):
+        chunk, delta = state['pending']
+        recv, send, info = repair_stg_counters(
+            chunk['uptime'].to_numpy(), chunk['recv'].to_numpy(), chunk['send'].to_numpy(), delta,
+            state['prev_uptime'], state['interval'], state['prev_rates'], final,
+        )
+        n = info['rows']
+        state['prev_uptime'], state['prev_rates'] = info['last_uptime'], info['last_rates']
+        for key in counts:
+            counts[key] += info[key]
+        if n:
+            aggregate(chunk['date'].iloc[:n], recv, send, delta[:n])
+        state['pending'] = (chunk.iloc[n:], delta[n:]) if n < len(chunk) else None
+
+    for idx, stg in enumerate(ordered):
+        with stg.read(chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                cancel()
+                clean_stg_frame(chunk)
+                chunk = chunk.drop_duplicates()
+                if not chunk['date'].is_monotonic_increasing:
+                    chunk = chunk.sort_values('date', kind='mergesort')
+                if last is None:
+                    # 1行目を削除する（取得値が非常に大きい場合があるため）
+                    chunk = chunk.iloc[1:]
+                    prev = chunk['date'].iloc[0] if len(chunk) else None
+                else:
+                    chunk = chunk[chunk['date'] > last]
+                    prev = last
+                if chunk.empty:
+                    continue
+                # delta_timeは前の分割の最終日時から計算する（全体の1行目はNaN）
+                dates = chunk['date']
+                delta = dates.diff().dt.total_seconds().to_numpy()
+                delta[0] = (dates.iloc[0] - prev).total_seconds() if prev != dates.iloc[0] else np.nan
+                last = dates.iloc[-1]
+                rows += len(chunk)
+
+                if not repair:
+                    aggregate(dates, chunk['recv'].to_numpy(), chunk['send'].to_numpy(), delta)
+                    continue
+                # 再起動・取得間隔の異常・負の値のカウンタ値を補正する
+                if state['pending'] is not None:
+                    chunk = pd.concat([state['pending'][0], chunk])
+                    delta = np.concatenate([state['pending'][1], delta])
+                state['pending'] = (chunk, delta)
+                if state['interval'] is None:
+                    if np.count_nonzero(np.isfinite(delta) & (delta > 0)) < STG_INTERVAL_ROWS:
+                        continue
+                    state['interval'] = stg_interval(delta)
+                repair_pending(final=False)
+        progress(f' [{idx+1}/{len(ordered)}] "{stg.filename}" ... {t.laptime:.3f} sec\n', idx + 1, len(ordered))
+    if state['pending'] is not None:
+        repair_pending(final=True)
+
+    if not partials:
+        raise ValueError('データ行がありません')
+    # 境界をまたいだ集計区間を合算し、データのない集計区間も含める（resampleと同じ）
+    df = pd.concat(partials).groupby(level=0).sum()
+    df = df.reindex(pd.date_range(df.index[0], df.index[-1], freq=rule, name='date'), fill_value=0)
+    df.attrs['rows'] = rows
+    df.attrs['repair'] = counts if repair else {}
+    return df
+
+
+@PERF.timed('resample')
+def resample_stg(df: pd.DataFrame, rule: str, date_from: str = None, date_to: str = None,
+                 axis_unit: str = 'Mbps', cache: ResampleCache = None, base_rule: str = None,
+                 buffer: ThroughputBuffer = None) -> tuple:
+    """指定の集計単位・期間でリサンプルしてスループットを計算する
+
+    Args:
+        df (pd.DataFrame): load_stg_filesで読み込んだDataFrame
+        rule (str): 集計単位（MEAN_TIMESの値）
+        date_from (str): 集計開始日（Noneなら先頭から）
+        date_to (str): 集計終了日（Noneなら末尾まで）
+        axis_unit (str): 縦軸の単位 bps / kbps / Mbps / Gbps
+        cache (ResampleCache): リサンプル結果のキャッシュ
+        base_rule (str): dfが集計済み（ストリーミング集計）の場合、その集計単位
+        buffer (ThroughputBuffer): スループットの列を書き込むバッファ（Noneなら新しい配列に書き込む）
+
+    Returns:
+        tuple: (DataFrame, 受信の列名, 送信の列名, 単位, 単位の除数, 受信MAXの文字列, 送信MAXの文字列)
+            （指定期間のデータがなければDataFrameは空）
+    """
+    # 集計済みのデータは、その集計単位で割り切れる粗い集計単位にのみ集計できる
+    if base_rule is not None and rule != base_rule:
+        if rule == 'org' or to_offset(rule).nanos % to_offset(base_rule).nanos:
+            names = {v: k for k, v in MEAN_TIMES.items()}
+            raise ValueError(f'{names[base_rule]}で集計したデータは{names[rule]}で集計できません')
+
+    # 指定時間で集約（集計結果は集計単位ごとにキャッシュする）
+    if rule == 'org' or rule == base_rule:
+        pass
+    elif cache is not None:
+        df = cache.get(df, rule)
+    else:
+        df = df.resample(rule=rule).sum()
+
+    # 指定期間を抽出（コピーしない）
+    df = period_slice(df, date_from, date_to)
+
+    # スループットを計算
+    if axis_unit == 'bps':
+        div_unit = 1
+    elif axis_unit == 'kbps':
+        div_unit = int(1e3)
+    elif axis_unit == 'Mbps':
+        div_unit = int(1e6)
+    elif axis_unit == 'Gbps':
+        div_unit = int(1e9)
+
+    # スループットの列は指定期間の分だけ計算する（元のDataFrameには追加しない）
+    #   delta_timeの列は元のDataFrameのビュー、スループットの列はバッファのビューのまま使う
+    recv_unit = 'recv_' + axis_unit
+    send_unit = 'send_' + axis_unit
+    out = buffer.acquire(len(df)) if buffer is not None else np.empty((2, len(df)))
+    delta_time = df['delta_time'].to_numpy()
+    df = pd.DataFrame({
+        'delta_time': delta_time,
+        recv_unit: throughput_into(df['recv'].to_numpy(), delta_time, div_unit, out[0]),
+        send_unit: throughput_into(df['send'].to_numpy(), delta_time, div_unit, out[1]),
+    }, index=df.index, copy=False)
+
+    # 指定期間のデータがなければ、空のDataFrameを返す（idxmaxは空のSeriesではエラーになるため）
+    if df.empty:
+        return (df, recv_unit, send_unit, axis_unit, div_unit, '受信MAX: データなし', '送信MAX: データなし')
+
+    # 送受信の最大値と発生日時を調べる
+    recv_max = df[recv_unit].max()
+    send_max = df[send_unit].max()
+    recv_max_date = re.sub(r'\.\d+$', '', str(df[recv_unit].idxmax()))
+    send_max_date = re.sub(r'\.\d+$', '', str(df[send_unit].idxmax()))
+
+    # 送受信の最大値の文字列を作成、MbpsとGbpsは少数点3桁表示
+    if axis_unit == 'Mbps' or axis_unit == 'Gbps':
+        recv_max_str = f'{recv_max:,.3f}'
+        send_max_str = f'{send_max:,.3f}'
+    else:
+        recv_max_str = f'{int(recv_max):,}'
+        send_max_str = f'{int(send_max):,}'
+
+    strlen_max = max(len(recv_max_str), len(send_max_str))
+
+    str1 = f'受信MAX: {recv_max_str:>{strlen_max}} {axis_unit} ({recv_max_date})'
+    str2 = f'送信MAX: {send_max_str:>{strlen_max}} {axis_unit} ({send_max_date})'
+
+    return (df, recv_unit, send_unit, axis_unit, div_unit, str1, str2)
+
+
+def stg_statistics(df: pd.DataFrame, recv_unit: str, send_unit: str, threshold: float = None,
+                   hourly: pd.DataFrame = None) -> tuple:
+    """resample_stgの結果（指定期間・集計単位）のスループットの統計値を計算する
+        送受信をまとめた配列に対して、パーセンタイル（p50 / p95 / p99、95パーセンタイル課金用）、
+        最大値と発生日時（idxmax）、閾値を超えた時間、日ごとに最も混雑した1時間を求める。
+        1時間の平均は取得間隔で重み付けして計算する。
+
+    Args:
+        df (pd.DataFrame): resample_stgのDataFrame
+        recv_unit (str): 受信の列名
+        send_unit (str): 送信の列名
+        threshold (float): 閾値（dfのスループットと同じ単位、Noneなら閾値を超えた時間は計算しない）
+        hourly (pd.DataFrame): 日ごとのピーク時間帯を求めるresample_stgのDataFrame（hourly_frame参照、
+            Noneならdfから求める）
+
+    Returns:
+        tuple: (統計値のDataFrame（行：項目、列：受信・送信）, 日ごとのピーク時間帯のDataFrame)
+    """
+    columns = [recv_unit, send_unit]
+    values = df[columns].to_numpy(dtype=np.float64)
+    values[~np.isfinite(values)] = np.nan      # 取得間隔が0の区間（inf）は除く
+    delta = df['delta_time'].to_numpy(dtype=np.float64)
+    delta = np.where(np.isnan(values).any(axis=1), 0, np.nan_to_num(delta))
+    rates = pd.DataFrame(values, index=df.index, columns=columns)
+
+    p50, p95, p99 = np.nanpercentile(values, [50, 95, 99], axis=0)
+    stats = {
+        'p50': p50,
+        'p95': p95,
+        'p99': p99,
+        '最大': rates.max().to_numpy(),
+        '最大日時': [str(date)[:19] for date in rates.idxmax()],
+    }
+    if threshold is not None:
+        seconds = (np.nan_to_num(values) > threshold).T @ delta
+        stats['閾値超過時間[秒]'] = seconds
+        stats['閾値超過率[%]'] = seconds / delta.sum() * 100 if delta.sum() else np.nan
+    summary = pd.DataFrame(stats, index=['受信', '送信']).T
+
+    # 1時間ごとの平均スループット（取得間隔で重み付け）から、日ごとに最大の1時間を求める
+    #   dfの集計単位が1時間より粗い場合は、1時間以下の集計単位のhourlyから求める
+    if hourly is not None:
+        values = hourly[columns].to_numpy(dtype=np.float64)
+        values[~np.isfinite(values)] = np.nan
+        delta = hourly['delta_time'].to_numpy(dtype=np.float64)
+        delta = np.where(np.isnan(values).any(axis=1), 0, np.nan_to_num(delta))
+        df = hourly
+    weighted = pd.DataFrame(np.nan_to_num(values) * delta[:, None], index=df.index, columns=columns)
+    weighted['delta_time'] = delta
+    hourly = weighted.groupby(df.index.floor('h')).sum()
+    hourly = hourly[columns].div(hourly['delta_time'].replace(0, np.nan), axis=0)
+    daily = hourly.groupby(hourly.index.date)
+    peak_hour, peak = daily.idxmax(), daily.max()
+    busiest = pd.DataFrame({
+        '受信ピーク時間帯': [f'{date:%H:00}' for date in peak_hour[recv_unit]],
+        f'受信ピーク平均[{recv_unit}]': peak[recv_unit],
+        '送信ピーク時間帯': [f'{date:%H:00}' for date in peak_hour[send_unit]],
+        f'送信ピーク平均[{send_unit}]': peak[send_unit],
+    }, index=pd.Index(peak.index, name='日付'))
+    return summary, busiest
+
+
+def hourly_frame(df: pd.DataFrame, rule: str, date_from: str = None, date_to: str = None, axis_unit: str = 'Mbps',
+                 cache: ResampleCache = None, base_rule: str = None) -> pd.DataFrame:
+    """stg_statisticsの日ごとのピーク時間帯を求めるDataFrame（1時間平均のresample_stgのDataFrame）を返す
+        ruleが1時間より粗いと、ruleの集計区間の開始時刻がそのままピーク時間帯になるため、1時間平均で集計し直す
+        （ResampleCacheがあれば集計済みの1時間平均を使う）。
+
+    Args:
+        df (pd.DataFrame): resample_stgに渡した元のDataFrame
+        rule (str): 統計値の集計単位（MEAN_TIMESの値）
+        date_from (str): 集計開始日（Noneなら先頭から）
+        date_to (str): 集計終了日（Noneなら末尾まで）
+        axis_unit (str): スループットの単位 bps / kbps / Mbps / Gbps
+        cache (ResampleCache): リサンプル結果のキャッシュ
+        base_rule (str): dfが集計済み（ストリーミング集計）の場合、その集計単位
+
+    Returns:
+        pd.DataFrame: ruleが1時間以下ならNone（resample_stgの結果をそのまま使う）、
+            dfが1時間より粗く集計済みの場合はピーク時間帯を求められないので空のDataFrame
+    """
+    hour = rule_nanos('1H')
+    if rule == 'org' or rule_nanos(rule) <= hour:
+        return None
+    if base_rule is not None and rule_nanos(base_rule) > hour:
+        columns = ['delta_time', f'recv_{axis_unit}', f'send_{axis_unit}']
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name=df.index.name), dtype=np.float64)
+    return resample_stg(df, '1H', date_from, date_to, axis_unit, cache=cache, base_rule=base_rule)[0]
+
+
+def write_statistics_csv(filename: str, summary: pd.DataFrame, busiest: pd.DataFrame):
+    """stg_statisticsの結果を1つのCSVファイルに出力する（統計値、空行、日ごとのピーク時間帯の順）
+    """
+    with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
+        summary.to_csv(f, sep=',', index_label='項目')
+        f.write('\n')
+        busiest.to_csv(f, sep=',')
+
+
+def _runs(mask: np.ndarray) -> tuple:
+    """Trueが連続する区間の (開始位置の配列, 終了位置（含まない）の配列) を返す
+    """
+    edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _rolling_baseline(values: np.ndarray, window: int) -> tuple:
+    """直前window区間（現在の区間を含めない）の移動中央値と、MADから求めたσ（下限はANOMALY_MIN_BPS）
+    """
+    series = pd.Series(values)
+    median = series.rolling(window, min_periods=window // 2).median()
+    mad = (series - median).abs().rolling(window, min_periods=window // 2).median()
+    return median.shift(1).to_numpy(), np.maximum(mad.shift(1).to_numpy() * 1.4826, ANOMALY_MIN_BPS)
+
+
+@PERF.timed('anomaly')
+def detect_anomalies(df: pd.DataFrame, cache: ResampleCache = None, base_rule: str = None,
+                     threshold: float = None) -> pd.DataFrame:
+    """受信・送信のスループットのバースト、平坦、レベル変化を検出する
+        元データをANOMALY_RULEで集計（ResampleCacheがあれば集計単位のピラミッドを使用）し、
+        区間ごとの平均・最大・最小のスループットに対する移動中央値・MADの計算と判定を
+        配列全体の演算だけで行う（ストリーミング集計のデータはその集計単位のまま判定する）。
+        連続して判定された区間は1つのイベントにまとめる。
+        カウンタ値の補正（repair_stg_counters）はバーストのスループットを変えないので、
+        補正の有無によらず同じバーストを検出する（補正するのは再起動・取得間隔の異常・負の値のサンプルだけ）。
+
+    Args:
+        df (pd.DataFrame): load_stg_filesで読み込んだDataFrame（またはストリーミング集計の結果）
+        cache (ResampleCache): リサンプル結果のキャッシュ
+        base_rule (str): dfが集計済み（ストリーミング集計）の場合、その集計単位
+        threshold (float): 閾値超過を検出する閾値（bps、Noneなら検出しない）
+
+    Returns:
+        pd.DataFrame: イベント（start: 開始日時, end: 終了日時, direction: recv / send,
+            kind: ANOMALY_KINDSのキー, value: スループット[bps], baseline: 基準のスループット[bps]）の開始日時順
+    """
+    columns = ['start', 'end', 'direction', 'kind', 'value', 'baseline']
+    rule = ANOMALY_RULE
+    if base_rule is not None and to_offset(base_rule).nanos >= to_offset(rule).nanos:
+        rule = base_rule
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    buckets = cache.get(df, rule) if cache is not None else aggregate_stg(df, rule)
+    step = pd.Timedelta(to_offset(rule).nanos)
+    index = buckets.index
+    count = buckets['count'].to_numpy()
+    delta = buckets['delta_time'].to_numpy(dtype=np.float64)
+    window = ANOMALY_WINDOW
+
+    events = []
+    for direction in ['recv', 'send']:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(delta > 0, buckets[direction].to_numpy(dtype=np.float64) * 8 / delta, np.nan)
+        peak = buckets[f'{direction}_max'].to_numpy()
+        low = buckets[f'{direction}_min'].to_numpy()
+
+        # 平均・最大スループットの直前window区間の中央値・σ（現在の区間を含めない）と、
+        # 平均スループットの直後window区間の中央値（現在の区間を含む）
+        before, sigma = _rolling_baseline(mean, window)
+        peak_before, peak_sigma = _rolling_baseline(peak, window)
+        after = pd.Series(mean[::-1]).rolling(window, min_periods=window // 2).median().to_numpy()[::-1]
+
+        with np.errstate(invalid='ignore'):
+            burst = (peak > peak_before + ANOMALY_SIGMA * peak_sigma) & (peak > peak_before * 2)
+            flat = (count > 1) & (peak - low <= ANOMALY_FLAT_TOLERANCE * peak)
+            change = np.abs(after - before)
+            shift = (change > ANOMALY_SHIFT_SIGMA * sigma) & (change > ANOMALY_SHIFT_RATIO * np.fmax(before, after))
+
+        # バースト：連続した区間の最大値（開始・終了位置を交互に並べたreduceatの偶数番目）
+        starts, ends = _runs(burst)
+        if len(starts):
+            bounds = np.column_stack([starts, ends]).ravel()
+            events.append(pd.DataFrame({
+                'start': index[starts], 'end': index[ends - 1] + step, 'direction': direction, 'kind': 'burst',
+                'value': np.fmax.reduceat(np.r_[peak, np.nan], bounds)[::2],
+                'baseline': peak_before[starts],
+            }))
+        # 平坦：ANOMALY_FLAT_MIN区間以上続くもの
+        starts, ends = _runs(flat)
+        keep = ends - starts >= ANOMALY_FLAT_MIN
+        starts, ends = starts[keep], ends[keep]
+        if len(starts):
+            events.append(pd.DataFrame({
+                'start': index[starts], 'end': index[ends - 1] + step, 'direction': direction, 'kind': 'flatline',
+                'value': peak[starts], 'baseline': before[starts],
+            }))
+        # レベル変化：連続した区間のうち変化が最大の区間
+        starts, ends = _runs(shift)
+        if len(starts):
+            pos = np.flatnonzero(shift)
+            group = np.searchsorted(starts, pos, side='right') - 1
+            order = np.lexsort((-change[pos], group))
+            first = np.r_[True, group[order][1:] != group[order][:-1]]
+            at = pos[order][first]
+            events.append(pd.DataFrame({
+                'start': index[at], 'end': index[at] + step, 'direction': direction, 'kind': 'level_shift',
+                'value': after[at], 'baseline': before[at],
+            }))
+        # 閾値超過：連続した区間の平均スループットの最大値
+        if threshold is not None:
+            with np.errstate(invalid='ignore'):
+                starts, ends = _runs(mean > threshold)
+            if len(starts):
+                bounds = np.column_stack([starts, ends]).ravel()
+                events.append(pd.DataFrame({
+                    'start': index[starts], 'end': index[ends - 1] + step, 'direction': direction,
+                    'kind': 'threshold', 'value': np.fmax.reduceat(np.r_[mean, np.nan], bounds)[::2],
+                    'baseline': threshold,
+                }))
+
+    if not events:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(events, ignore_index=True).sort_values(['start', 'direction'], ignore_index=True)
+
+
+@PERF.timed('export')
+def export_frame(df: pd.DataFrame, filename: str, fmt: str = 'csv', chunk_rows: int = EXPORT_CHUNK_ROWS,
+                 cancel=None):
+    """DataFrameをchunk_rows行ずつファイルに書き込む
+        書込中は一時ファイルに書き込み、完了したらファイル名を変更する（中止した場合は削除する）
+
+    Args:
+        df (pd.DataFrame): 出力するDataFrame（インデックスも出力する）
+        filename (str): 出力ファイル名
+        fmt (str): 出力形式（EXPORT_FORMATSのキー）
+        chunk_rows (int): 一度に書き込む行数
+        cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+    """
+    cancel = cancel or (lambda: None)
+    if fmt in ('parquet', 'feather') and pyarrow is None:
+        raise ValueError(f'{EXPORT_FORMATS[fmt]}形式の出力にはpyarrowが必要です')
+    chunks = (df.iloc[start:start + chunk_rows] for start in range(0, max(len(df), 1), chunk_rows))
+    tmp = f'{filename}.tmp'
+    try:
+        if fmt in ('csv', 'csv.gz'):
+            opener = gzip.open if fmt == 'csv.gz' else open
+            with opener(tmp, 'wt', newline='') as f:
+                for i, chunk in enumerate(chunks):
+                    chunk.to_csv(f, sep=',', header=(i == 0))
+                    cancel()
+        else:
+            from pyarrow import ipc, parquet
+            writer = None
+            try:
+                for chunk in chunks:
+                    table = pyarrow.Table.from_pandas(chunk.reset_index(), preserve_index=False)
+                    if writer is None:
+                        if fmt == 'parquet':
+                            writer = parquet.ParquetWriter(tmp, table.schema)
+                        else:
+                            options = ipc.IpcWriteOptions(compression='lz4')
+                            writer = ipc.new_file(tmp, table.schema, options=options)
+                    writer.write_table(table)
+                    cancel()
+            finally:
+                if writer is not None:
+                    writer.close()
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
 
+def export_targets(targets: list, rules: list, date_from: str = None, date_to: str = None,
+                   axis_unit: str = 'Mbps', fmt: str = 'csv', threshold: float = None,
+                   progress=None, cancel=None) -> list:
+    """ターゲットごとに、複数の集計単位のスループットと統計情報をファイルに出力する
+        集計単位は細かい順に集計し、粗い集計単位は細かい集計単位の結果から集計する（ResampleCache）ので、
+        元データの集計は1回で済む。ファイル名は「ターゲットアドレス_集計単位の名前.拡張子」
+        指定期間のデータがないターゲットは出力せず、progressに出力する（どのターゲットにもなければValueError）
 
-def now(format: str = '%Y-%m-%d %H:%M:%S') -> str:
-    """現在時刻文字列を返す
+    Args:
+        targets (list): ターゲットのdictのリスト（resample_targets参照）
+        rules (list): 集計単位（MEAN_TIMESの値）のリスト
+        date_from (str): 集計開始日（Noneなら先頭から）
+        date_to (str): 集計終了日（Noneなら末尾まで）
+        axis_unit (str): スループットの単位 bps / kbps / Mbps / Gbps
+        fmt (str): 出力形式（EXPORT_FORMATSのキー）
+        threshold (float): 統計情報の閾値（bps、Noneなら閾値を超えた時間は出力しない）
+        progress (callable): 進捗の出力先 progress(メッセージ, 処理済み数, 全体数)
+        cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+
+    Returns:
+        list: 出力したファイル名のリスト
     """
-    return datetime.datetime.now().strftime(format)
+    progress = progress or (lambda text, done=None, total=None: None)
+    cancel = cancel or (lambda: None)
+    names = {v: k for k, v in MEAN_TIMES.items()}
+    rules = sorted(rules, key=lambda rule: 0 if rule == 'org' else to_offset(rule).nanos)
+    outputs = []
+    frames = period_targets(targets, date_from, date_to)
+    if not frames:
+        raise ValueError(f'指定期間（{date_from} ～ {date_to}）のデータがありません')
+    for target in targets:
+        if not any(target is t for t, _ in frames):
+            progress(f' {target["target_ip"]}：指定期間のデータがないため出力しません\n')
+    total = len(frames) * len(rules)
+    for target, frame in frames:
+        for rule in rules:
+            t = ExecTime()
+            resampled = resample_stg(
+                frame, rule, date_from, date_to, axis_unit,
+                cache=target['resample_cache'], base_rule=target['base_rule'],
+            )
+            (df, recv_unit, send_unit, axis_unit, div_unit, *_) = resampled
+            basename = f'{target["target_ip"]}_{names[rule]}'
+            export_frame(df[['delta_time', recv_unit, send_unit]], f'{basename}.{fmt}', fmt, cancel=cancel)
+            outputs.append(f'{basename}.{fmt}')
+            hourly = hourly_frame(
+                frame, rule, date_from, date_to, axis_unit,
+                cache=target['resample_cache'], base_rule=target['base_rule'],
+            )
+            write_statistics_csv(
+                f'{basename}_統計.csv',
+                *stg_statistics(df, recv_unit, send_unit, None if threshold is None else threshold / div_unit, hourly),
+            )
+            outputs.append(f'{basename}_統計.csv')
+            progress(f' "{os.path.abspath(basename)}.{fmt}" ... {t.laptime:.3f} sec\n', len(outputs) // 2, total)
+            cancel()
+    return outputs
+
+
+def format_statistics(summary: pd.DataFrame, axis_unit: str) -> str:
+    """stg_statisticsの統計値を表示用の文字列にする
+    """
+    lines = []
+    for item, (recv, send) in summary.iterrows():
+        if item == '最大日時':
+            lines.append(f'  {item}: 受信 {recv} / 送信 {send}')
+        elif item.startswith('閾値超過'):
+            lines.append(f'  {item}: 受信 {recv:,.1f} / 送信 {send:,.1f}')
+        else:
+            lines.append(f'  {item}: 受信 {recv:,.3f} {axis_unit} / 送信 {send:,.3f} {axis_unit}')
+    return '\n'.join(lines)
+
+
+def adjust_axes(ax, axis_unit: str, div_unit: int, r_max: str, s_max: str,
+                axis_type: str = 'auto', axis_value: int = 0):
+    """グラフのaxesの見栄えを調整する
+
+    Args:
+        ax: matplotlibのAxes
+        axis_unit (str): 縦軸の単位
+        div_unit (int): 単位の除数
+        r_max (str): 受信MAXの文字列
+        s_max (str): 送信MAXの文字列
+        axis_type (str): 縦軸の指定方法 auto / fix / specified
+        axis_value (int): 縦軸の高さ（bps）
+    """
+    # X軸ラベル
+    ax.set_xlabel('日時')
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d %H:%M'))
+    ax.xaxis.set_minor_locator(AutoMinorLocator(6))
+    # Y軸ラベル
+    ax.set_ylabel(axis_unit)
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, loc: f'{x:,.1f}'))
+    ax.yaxis.set_minor_locator(AutoMinorLocator())
+    # グリッド線
+    ax.grid(visible=True, axis='both', which='major', color='gray', linestyle='--', alpha=0.9)
+    ax.grid(visible=True, axis='both', which='minor', color='gray', linestyle='--', alpha=0.2)
+    # Y軸のスケール
+    if axis_type == 'auto':
+        ax.set_ylim(0,)
+    else:
+        ax.set_ylim([0, axis_value // div_unit])
+
+    # 送受信の最大値をグラフ上にテキスト表示
+    ax.text(0.05, 0.9, r_max + '\n' + s_max, family='ms gothic', transform=ax.transAxes)
+
+
+def target_stg_frame(target: dict, date_from: str = None, date_to: str = None) -> pd.DataFrame:
+    """ターゲットの指定期間を含むDataFrameを返す（履歴ストアのターゲットは指定期間の日だけを読み込む）
+    """
+    if target.get('store') is not None:
+        return target['store'].query(target['target_ip'], date_from, date_to)
+    return target['df']
+
+
+def period_targets(targets: list, date_from: str = None, date_to: str = None) -> list:
+    """指定期間のデータがあるターゲットの (ターゲットのdict, target_stg_frameのDataFrame) のリストを返す
+    """
+    frames = [(t, target_stg_frame(t, date_from, date_to)) for t in targets]
+    return [(t, df) for t, df in frames if not period_slice(df, date_from, date_to).empty]
+
+
+def zoom_frame(target: dict, rule: str, date_from: str, date_to: str, x_from: int, x_to: int, width: int,
+               axis_unit: str = 'Mbps', max_rows: int = ZOOM_MAX_ROWS) -> tuple:
+    """プレビューの表示範囲のスループットを、選択中の集計単位より細かいデータから求める
+        表示範囲の選択中の集計単位の行数が描画領域の幅（ピクセル数）より少ない場合に、
+        細かい集計単位（ResampleCacheの集計済みのもの）のうち表示範囲の行数が幅以上になる最も粗いもの、
+        なければ元データを使う。表示範囲の行数がmax_rowsを超えるデータは使わない。
+        未集計の集計単位は使わない（Tkのメインスレッドで全体を集計しないように）。
+
+    Args:
+        target (dict): ターゲットのdict（resample_targets参照、履歴ストアのターゲットは対象外）
+        rule (str): 選択中の集計単位（MEAN_TIMESの値）
+        date_from (str): 集計開始日（Noneなら先頭から）
+        date_to (str): 集計終了日（Noneなら末尾まで）
+        x_from (int): 表示範囲の開始日時（ナノ秒）
+        x_to (int): 表示範囲の終了日時（ナノ秒）
+        width (int): 描画領域の幅（ピクセル数）
+        axis_unit (str): 縦軸の単位 bps / kbps / Mbps / Gbps
+        max_rows (int): 表示範囲の行数の上限
+
+    Returns:
+        tuple: resample_stgの戻り値（選択中の集計単位で足りる、または細かいデータがない場合はNone）
+    """
+    base = target['base_rule'] or 'org'
+    if target.get('store') is not None or rule == base:
+        return None
+    df = target['df']
+    cache = target['resample_cache']
+
+    def window(frame):
+        # 表示範囲の行を二分探索で求める（線が途切れないよう前後1行を含める）
+        frame = period_slice(frame, date_from, date_to)
+        index = frame.index.asi8
+        start = max(np.searchsorted(index, x_from, side='left') - 1, 0)
+        stop = min(np.searchsorted(index, x_to, side='right') + 1, len(index))
+        return frame.iloc[start:stop]
+
+    selected = cache.cached(df, rule)
+    if selected is None or len(window(selected)) >= width:
+        return None
+    candidates = [(base, df)]
+    for r in sorted((r for r in MEAN_TIMES.values() if r != 'org'), key=rule_nanos):
+        if rule_nanos(r) >= rule_nanos(rule):
+            break
+        if base != 'org' and (rule_nanos(r) <= rule_nanos(base) or rule_nanos(r) % rule_nanos(base)):
+            continue
+        level = cache.cached(df, r)
+        if level is not None:
+            candidates.append((r, level))
+
+    # 粗い順に調べ、行数が幅以上になったものを使う（細かいほど行数が多い）
+    chosen = None
+    for r, frame in reversed(candidates):
+        frame = window(frame)
+        if len(frame) > max_rows:
+            break
+        chosen = (r, frame)
+        if len(frame) >= width:
+            break
+    if chosen is None or chosen[1].empty:
+        return None
+    r, frame = chosen
+    return resample_stg(frame, r, axis_unit=axis_unit, base_rule=None if r == 'org' else r)
+
+
+def detect_targets_anomalies(targets: list, date_from: str = None, date_to: str = None, threshold: float = None,
+                             progress=None, cancel=None) -> pd.DataFrame:
+    """ターゲットごとに異常を検出し、ターゲットのアドレス（target_ip列）を付けて開始日時順にまとめる
+        履歴ストアのターゲットは指定期間の日だけを対象にする（それ以外は読み込んだ全期間）
+
+    Args:
+        targets (list): ターゲットのdictのリスト（resample_targets参照）
+        date_from (str): 履歴ストアから読み込む開始日
+        date_to (str): 履歴ストアから読み込む終了日
+        threshold (float): 閾値超過を検出する閾値（bps、Noneなら検出しない）
+        progress (callable): 進捗の出力先 progress(メッセージ, 処理済み数, 全体数)
+        cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+
+    Returns:
+        pd.DataFrame: detect_anomaliesのイベントにtarget_ip列を加えたもの
+    """
+    progress = progress or (lambda text, done=None, total=None: None)
+    cancel = cancel or (lambda: None)
+    events = []
+    for count, target in enumerate(targets, 1):
+        df = detect_anomalies(
+            target_stg_frame(target, date_from, date_to), target['resample_cache'], target['base_rule'], threshold,
+        )
+        events.append(df.assign(target_ip=target['target_ip']))
+        progress('', count, len(targets))
+        cancel()
+    return pd.concat(events, ignore_index=True).sort_values(['start', 'target_ip'], ignore_index=True)
+
+
+def resample_targets(targets: list, rule: str, date_from: str = None, date_to: str = None,
+                     axis_unit: str = 'Mbps', reuse_buffers: bool = False, cancel=None) -> list:
+    """複数のターゲットを並列にリサンプルする
+        指定期間のデータがないターゲットは（先頭のターゲットも）除く。どのターゲットにもなければValueError
+
+    Args:
+        targets (list): ターゲットのdictのリスト
+            （target_ip: ターゲットアドレス, df: DataFrame, resample_cache: ResampleCache, base_rule: 集計単位、
+              store: 履歴ストアから読み込む場合はStgStore、buffer: ThroughputBuffer）
+        rule (str): 集計単位（MEAN_TIMESの値）
+        date_from (str): 集計開始日（Noneなら先頭から）
+        date_to (str): 集計終了日（Noneなら末尾まで）
+        axis_unit (str): 縦軸の単位 bps / kbps / Mbps / Gbps
+        reuse_buffers (bool): スループットの列をターゲットのbufferに書き込む（表示したらbufferのcommitを呼ぶこと）
+        cancel (callable): 中止の確認（中止する場合は例外を発生させる）
+
+    Returns:
+        list: (ターゲットアドレス, resample_stgの戻り値) のリスト
+    """
+    cancel = cancel or (lambda: None)
+    frames = period_targets(targets, date_from, date_to)
+    if not frames:
+        raise ValueError(f'指定期間（{date_from} ～ {date_to}）のデータがありません')
+    targets = [t for t, _ in frames]
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        futures = [
+            executor.submit(
+                resample_stg, df, rule, date_from, date_to, axis_unit,
+                cache=t['resample_cache'], base_rule=t['base_rule'],
+                buffer=t['buffer'] if reuse_buffers else None,
+            )
+            for t, df in frames
+        ]
+        results = []
+        for t, future in zip(targets, futures):
+            results.append((t['target_ip'], future.result()))
+            cancel()
+    return results
+
+
+@PERF.timed('plot')
+def plot_targets(ax, results: list, mean_time: str, axis_type: str = 'auto', axis_value: int = 0):
+    """resample_targetsの結果を1つのグラフに重ねて描画する
+        系列名はターゲットが複数の場合のみ、ターゲットアドレスを付ける
+
+    Args:
+        ax: matplotlibのAxes
+        results (list): (ターゲットアドレス, resample_stgの戻り値) のリスト
+        mean_time (str): 集計単位の名前
+        axis_type (str): 縦軸の指定方法 auto / fix / specified
+        axis_value (int): 縦軸の高さ（bps）
+    """
+    r_maxs, s_maxs = [], []
+    for target_ip, (df, recv_unit, send_unit, axis_unit, div_unit, r_max, s_max) in results:
+        if len(results) > 1:
+            df = df.rename(columns={recv_unit: f'{target_ip} {recv_unit}', send_unit: f'{target_ip} {send_unit}'})
+            recv_unit, send_unit = f'{target_ip} {recv_unit}', f'{target_ip} {send_unit}'
+            r_max, s_max = f'{target_ip} {r_max}', f'{target_ip} {s_max}'
+        df.plot(
+            ax=ax,
+            grid=True,
+            y=[recv_unit, send_unit],
+            title=f'{" / ".join(ip for ip, _ in results)} スループット（{mean_time}）',
+            rot=30,
+            x_compat=True
+            )
+        r_maxs.append(r_max)
+        s_maxs.append(s_max)
+
+    # axesの見栄えを調整する
+    adjust_axes(ax, axis_unit, div_unit, '\n'.join(r_maxs), '\n'.join(s_maxs), axis_type, axis_value)
+
+
+def plot_figure(results: list, mean_time: str, figsize: tuple = DASHBOARD_FIGSIZE,
+                axis_type: str = 'auto', axis_value: int = 0) -> Figure:
+    """resample_targetsの結果を重ねて描画したFigureを返す
+        pyplotを使わずAggで描画するので、Tkのメインスレッド以外（ワーカーのプロセス・スレッド）でも使用できる
+        描画時間は plot_targets で計測する（ここでも計測すると'plot'を二重に計上するため）
+
+    Args:
+        results (list): (ターゲットアドレス, resample_stgの戻り値) のリスト
+        mean_time (str): 集計単位の名前
+        figsize (tuple): グラフのサイズ（インチ）
+        axis_type (str): 縦軸の指定方法 auto / fix / specified
+        axis_value (int): 縦軸の高さ（bps）
+
+    Returns:
+        Figure: 描画したFigure（savefigでファイルに保存する）
+    """
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    plot_targets(ax, results, mean_time, axis_type, axis_value)
+    fig.tight_layout()
+    return fig
+
+
+class LruCache():
+    """容量を超えたら使用が古いものから削除する辞書（バックグラウンド処理から使用するためロックする）
+        容量は sizeof(値) の合計（省略時は件数）
+    """
+    def __init__(self, max_size: int, sizeof=None):
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.items:
+                self.size -= self.sizeof(self.items.pop(key))
+            self.items[key] = value
+            self.size += self.sizeof(value)
+            while self.size > self.max_size and len(self.items) > 1:
+                _, old = self.items.popitem(last=False)
+                self.size -= self.sizeof(old)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """ダッシュボードのリクエストの処理（self.server.dashboardがDashboardServer）
+        /             ターゲットの一覧と、グラフ・CSVの条件を指定するフォーム
+        /graph.png    グラフ（targetを複数指定すると重ねて描画する）
+        /data.csv     スループットのCSV（output_csvと同じ列）
+        クエリ: target=ターゲットアドレス, mean_time=集計単位（名前または値）, from=開始日, to=終了日,
+                unit=縦軸の単位, axis=縦軸の高さ（bps、省略時は自動）
+    """
+    CONTENT_TYPES = {
+        'graph.png': 'image/png',
+        'data.csv': 'text/csv; charset=utf-8',
+    }
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        name = url.path.strip('/')
+        try:
+            if name == '':
+                self._send(200, 'text/html; charset=utf-8', self.server.dashboard.index().encode('utf-8'))
+                return
+            if name not in self.CONTENT_TYPES:
+                self.send_error(404)
+                return
+            etag, body = self.server.dashboard.content(name, parse_qs(url.query))
+        # エラーの内容は日本語を含むので、ステータス行ではなく本文に出力する
+        except KeyError as err:
+            self.send_error(404, explain=f'ターゲットがありません: {err}')
+            return
+        except ValueError as err:
+            self.send_error(400, explain=str(err))
+            return
+        except Exception as err:
+            self.send_error(500, explain=f'{type(err).__name__}: {err}')
+            return
+        # 同じ内容ならブラウザのキャッシュを使わせる（データの更新を反映するため毎回確認させる）
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self._send(200, self.CONTENT_TYPES[name], body, etag)
+
+    def _send(self, code: int, content_type: str, body: bytes, etag: str = None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass    # pythonwで起動するとsys.stderrがないため、アクセスログは出力しない
+
+
+class DashboardServer():
+    """読込済みのターゲットのグラフ（PNG）とスループットのCSVをHTTPで提供するサーバー
+        リクエストはスレッドで受け付け、グラフ・CSVの作成はワーカーのスレッドで行う（同じ条件の同時のリクエストは
+        1回だけ作成する）。集計結果はターゲット・集計単位・期間ごとに、作成したグラフ・CSVはETagとともにLRUで
+        キャッシュする。キャッシュは元のDataFrameが変わったら（追従モードの追記など）使用しない。
+
+    Args:
+        targets (callable): 読込済みのターゲットのdictのリストを返す関数（resample_targets参照、
+            サーバーのスレッドから呼び出すのでTkのウィジェットを操作しないこと）
+        host (str): 待ち受けるアドレス（DASHBOARD_PUBLIC_HOSTなら他のPCから表示できる）
+        port (int): 待ち受けるポート番号
+        workers (int): グラフ・CSVを作成するワーカー数
+    """
+    def __init__(self, targets, host: str = DASHBOARD_HOST, port: int = DASHBOARD_PORT,
+                 workers: int = DASHBOARD_WORKERS):
+        self.targets = targets
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.results = LruCache(DASHBOARD_RESULTS)     # (ターゲット, 集計単位, 期間, 単位) → (元のDataFrameの参照, 集計結果)
+        self.contents = LruCache(DASHBOARD_CACHE_BYTES, sizeof=lambda value: len(value[2]))
+        self.pending = {}       # 作成中のグラフ・CSVのFuture
+        self.lock = threading.Lock()
+        self.executor = None
+        self.httpd = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host or socket.gethostname()}:{self.port}/'
+
+    def start(self):
+        """待ち受けを開始する（ポートが使用中ならOSErrorが発生する）
+        """
+        self.httpd = ThreadingHTTPServer((self.host, self.port), DashboardHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.dashboard = self
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.httpd = None
+        self.results.clear()
+        self.contents.clear()
+
+    def _loaded(self) -> dict:
+        return {
+            t['target_ip']: t for t in self.targets()
+            if t['target_ip'] is not None and (not t['df'].empty or t.get('store') is not None)
+        }
+
+    def index(self) -> str:
+        """ターゲットの一覧とグラフ・CSVの条件を指定するフォームのHTML
+        """
+        targets = self._loaded()
+        options = ''.join(f'<option value="{html.escape(ip)}">{html.escape(ip)}</option>' for ip in targets)
+        mean_times = ''.join(
+            f'<option{" selected" if name == "1時間平均" else ""}>{html.escape(name)}</option>' for name in MEAN_TIMES
+        )
+        units = ''.join(
+            f'<option{" selected" if unit == "Mbps" else ""}>{unit}</option>' for unit in ['bps', 'kbps', 'Mbps', 'Gbps']
+        )
+        rows = ''.join(
+            f'<li>{html.escape(ip)}（{t["df"].index[0]:%Y-%m-%d} ～ {t["df"].index[-1]:%Y-%m-%d}）</li>'
+            if not t['df'].empty else f'<li>{html.escape(ip)}（履歴ストア）</li>'
+            for ip, t in targets.items()
+        )
+        return f"""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>STG Graph Plot</title></head>
+<body>
+<h1>STG Graph Plot</h1>
+<ul>{rows}</ul>
+<form action="graph.png">
+<p>ターゲット（複数選択で重ねて表示）<br><select name="target" multiple size="{max(len(targets), 2)}">{options}</select></p>
+<p>集計単位 <select name="mean_time">{mean_times}</select>
+対象期間 <input type="date" name="from"> ～ <input type="date" name="to">
+単位 <select name="unit">{units}</select></p>
+<p><button type="submit">グラフ</button>
+<button type="submit" formaction="data.csv">CSV</button></p>
+</form>
+</body></html>
+"""
+
+    def content(self, name: str, query: dict) -> tuple:
+        """グラフ・CSVの (ETag, 内容) を返す（キャッシュになければワーカーで作成して完了を待つ）
+
+        Args:
+            name (str): graph.png / data.csv
+            query (dict): parse_qsしたクエリ
+
+        Returns:
+            tuple: (ETag, 内容のbytes)
+        """
+        loaded = self._loaded()
+        targets = [loaded[ip] for ip in query.get('target', [])]
+        if not targets:
+            raise ValueError('targetを指定してください')
+        if name == 'data.csv' and len(targets) > 1:
+            raise ValueError('CSVはターゲットを1つだけ指定してください')
+        mean_time = query.get('mean_time', ['1時間平均'])[0]
+        names = {v: k for k, v in MEAN_TIMES.items()}
+        if mean_time in names:
+            mean_time = names[mean_time]
+        if mean_time not in MEAN_TIMES:
+            raise ValueError(f'集計単位が不正です: {mean_time}')
+        date_from, date_to = [query.get(key, [''])[0] or None for key in ('from', 'to')]
+        for date in (date_from, date_to):
+            if date is not None:
+                pd.Timestamp(date)      # 日付でなければValueError
+        unit = query.get('unit', ['Mbps'])[0]
+        if unit not in ['bps', 'kbps', 'Mbps', 'Gbps']:
+            raise ValueError(f'単位が不正です: {unit}')
+        axis_value = int(query.get('axis', ['0'])[0] or 0)
+
+        frames = [target_stg_frame(t, date_from, date_to) for t in targets]
+        key = (name, tuple(t['target_ip'] for t in targets), mean_time, date_from, date_to, unit, axis_value)
+        with self.lock:
+            cached = self.contents.get(key)
+            if cached is not None and all(ref() is df for ref, df in zip(cached[0], frames)):
+                return cached[1], cached[2]
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._render, key, targets, frames)
+                self.pending[key] = future
+        return future.result()
+
+    def _resample(self, target: dict, df: pd.DataFrame, rule: str, date_from: str, date_to: str, unit: str) -> tuple:
+        """ターゲット・集計単位・期間ごとにキャッシュしたresample_stgの結果
+            履歴ストアのターゲットはGUIのResampleCacheを使わない（期間の異なるDataFrameで破棄しないように）
+        """
+        key = (target['target_ip'], rule, date_from, date_to, unit)
+        cached = self.results.get(key)
+        if cached is not None and cached[0]() is df:
+            return cached[1]
+        resampled = resample_stg(
+            df, rule, date_from, date_to, unit,
+            cache=target['resample_cache'] if target.get('store') is None else None, base_rule=target['base_rule'],
+        )
+        self.results.put(key, (weakref.ref(df), resampled))
+        return resampled
+
+    def _render(self, key: tuple, targets: list, frames: list) -> tuple:
+        name, _, mean_time, date_from, date_to, unit, axis_value = key
+        try:
+            results = [
+                (t['target_ip'], self._resample(t, df, MEAN_TIMES[mean_time], date_from, date_to, unit))
+                for t, df in zip(targets, frames)
+            ]
+            # 指定期間のデータがないターゲットは除く
+            results = [result for result in results if not result[1][0].empty]
+            if not results:
+                raise ValueError(f'指定期間（{date_from} ～ {date_to}）のデータがありません')
+            if name == 'graph.png':
+                fig = plot_figure(results, mean_time, DASHBOARD_FIGSIZE, 'specified' if axis_value else 'auto', axis_value)
+                with io.BytesIO() as f:
+                    fig.savefig(f, format='png')
+                    body = f.getvalue()
+            else:
+                (df, recv_unit, send_unit, *_) = results[0][1]
+                body = df[['delta_time', recv_unit, send_unit]].to_csv(sep=',').encode('utf-8')
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            self.contents.put(key, ([weakref.ref(df) for df in frames], etag, body))
+            return etag, body
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+
+class PreviewRenderer():
+    """プレビューのグラフを描画する
+        初回（ターゲットが変わったとき）だけ plot_targets で描画し、系列のLine2Dと最大値のテキストを保持する。
+        2回目以降はax.cla()とdf.plotを行わず、保持したLine2Dのデータ（set_data）とテキストだけを更新して
+        表示範囲を合わせ直す。軸の書式は初回に設定したものをそのまま使う。
+    """
+    def __init__(self, ax):
+        self.ax = ax
+        self.lines = []         # 系列のLine2D（ターゲットごとに受信・送信の順）
+        self.text = None        # 最大値のテキスト
+        self.targets = None     # 描画中のターゲットアドレスのリスト
+
+    def draw(self, results: list, mean_time: str, axis_type: str = 'auto', axis_value: int = 0) -> bool:
+        """resample_targetsの結果を描画する（キャンバスの再描画は呼出し側で行う）
+
+        Returns:
+            bool: Axesを作り直した場合True（Axesのコールバックの登録は解除されている）
+        """
+        ax = self.ax
+        targets = [target_ip for target_ip, _ in results]
+        if targets != self.targets:
+            ax.cla()
+            plot_targets(ax, results, mean_time, axis_type, axis_value)
+            self.lines = ax.get_lines()[:2 * len(results)]
+            self.text = ax.texts[-1]
+            self.targets = targets
+            return True
+        self._update(results, mean_time, axis_type, axis_value)
+        return False
+
+    @PERF.timed('plot')
+    def _update(self, results: list, mean_time: str, axis_type: str, axis_value: int):
+        """保持したLine2Dとテキストのデータだけを更新する
+        """
+        ax = self.ax
+        # 系列のデータ、系列名、最大値のテキストを更新する
+        lines = iter(self.lines)
+        r_maxs, s_maxs = [], []
+        for target_ip, (df, recv_unit, send_unit, axis_unit, div_unit, r_max, s_max) in results:
+            x = mdates.date2num(df.index.to_numpy())
+            prefix = f'{target_ip} ' if len(results) > 1 else ''
+            for line, column in zip(lines, [recv_unit, send_unit]):
+                line.set_data(x, df[column].to_numpy())
+                line.set_label(prefix + column)
+            r_maxs.append(prefix + r_max)
+            s_maxs.append(prefix + s_max)
+        ax.set_title(f'{" / ".join(target_ip for target_ip, _ in results)} スループット（{mean_time}）')
+        ax.set_ylabel(axis_unit)
+        ax.legend()
+        self.text.set_text('\n'.join(r_maxs) + '\n' + '\n'.join(s_maxs))
+
+        # 表示範囲をデータに合わせ直す
+        ax.relim()
+        ax.autoscale(True)
+        if axis_type == 'auto':
+            ax.set_ylim(0,)
+        else:
+            ax.set_ylim([0, axis_value // div_unit])
+
+
+class JobCancelled(Exception):
+    """バックグラウンド処理の中止
+    """
+
+
+class BackgroundJob():
+    """バックグラウンド処理
+        処理はワーカースレッドで実行し、進捗と結果はキューを経由して
+        Tkのメインループ（after）で受け取る。Tkはスレッドセーフではないため、
+        ウィジェットの操作はすべてコールバック（メインスレッド）で行うこと。
+    """
+    def __init__(self, widget, executor, on_done=None, on_progress=None, on_error=None, on_cancel=None,
+                 on_finish=None):
+        """初期化
+
+        Args:
+            widget: afterを呼び出すウィジェット
+            executor: 処理を実行するExecutor
+            on_done (callable): 正常終了時の処理 on_done(処理結果)
+            on_progress (callable): 進捗の表示 on_progress(メッセージ, 処理済み数, 全体数)
+            on_error (callable): エラー時の処理 on_error(例外)
+            on_cancel (callable): 中止時の処理
+            on_finish (callable): 終了時（正常終了・エラー・中止とも）の処理 on_finish(job)
+        """
+        self.widget = widget
+        self.executor = executor
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.on_finish = on_finish
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+
+    def start(self, func, *args, **kwargs):
+        """処理を開始する
+        """
+        self.executor.submit(self._run, func, *args, **kwargs)
+        self.widget.after(JOB_POLL_MS, self._poll)
+        return self
+
+    def _run(self, func, *args, **kwargs):
+        """ワーカースレッドで処理を実行し、結果をキューに入れる
+        """
+        try:
+            self.check_cancel()
+            self.queue.put(('done', func(*args, **kwargs)))
+        except JobCancelled:
+            self.queue.put(('cancel', None))
+        except Exception as err:
+            self.queue.put(('error', err))
+
+    def progress(self, text: str = '', done: int = None, total: int = None):
+        """進捗をキューに入れる（ワーカースレッドから呼び出す）
+        """
+        self.queue.put(('progress', (text, done, total)))
+
+    def check_cancel(self):
+        """中止が指示されていたら例外を発生させる（ワーカースレッドから呼び出す）
+        """
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        """中止を指示する
+        """
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def _poll(self):
+        """キューを確認してコールバックを呼び出す（メインスレッドで実行）
+        """
+        while True:
+            try:
+                kind, value = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                if self.on_progress:
+                    self.on_progress(*value)
+                continue
+            # 中止指示後に終了した処理の結果は使用しない
+            if kind == 'done' and self.cancelled:
+                kind = 'cancel'
+            try:
+                if kind == 'done' and self.on_done:
+                    self.on_done(value)
+                elif kind == 'error' and self.on_error:
+                    self.on_error(value)
+                elif kind == 'cancel' and self.on_cancel:
+                    self.on_cancel()
+            finally:
+                if self.on_finish:
+                    self.on_finish(self)
+            return
+        self.widget.after(JOB_POLL_MS, self._poll)
 
 
 class MyLabelFrame(tk.LabelFrame):
@@ -226,7 +2926,7 @@ class SelectAxisScaleFrame(MyLabelFrame):
     def __init__(self, master=None, **kwargs):
         super().__init__(master=master, text='縦軸の設定', **kwargs)
 
-        global var_axis_unit, var_axis_type, var_axis_value
+        global var_axis_unit, var_axis_type, var_axis_value, var_threshold
         self.var_axis_unit = var_axis_unit
         self.var_axis_type = var_axis_type
         self.var_axis_value = var_axis_value
@@ -286,48 +2986,273 @@ class SelectAxisScaleFrame(MyLabelFrame):
         self.sb.grid(row=2, column=1, sticky=tk.W)
         tk.Label(lf, text='bps').grid(row=2, column=2)  # 単位を表示
 
-        # 固定値の初期値に合わせて値を設定
-        self.set_var_axis_value()
+        # 子フレーム：統計情報の閾値 ====================
+        lf = MyLabelFrame(self, text='閾値（統計情報）')
+        lf.pack(anchor=tk.W, fill=tk.X)
+        MySpinbox(
+            master=lf, from_=0, to=100e9, increment=int(1e6),
+            textvariable=var_threshold,
+        ).pack(anchor=tk.W, side=tk.LEFT)
+        tk.Label(lf, text='bps').pack(anchor=tk.W, side=tk.LEFT)  # 単位を表示
+
+        # 固定値の初期値に合わせて値を設定
+        self.set_var_axis_value()
+
+    def wheel(self, event):
+        increment = int(self.sb.config('increment')[-1])  # incrementの現在値を抽出
+        value = self.var_axis_value.get()
+        if (event.delta > 0):  # 上向きホイール
+            value += increment
+        elif (event.delta < 0):  # 下向きホイール
+            value -= increment
+        if value <= 0:
+            value = increment
+        self.var_axis_value.set(value)
+
+    def set_var_axis_value(self, event=None):
+        self.var_axis_value.set(self.AXIS_VALUES[self.cb.get()])
+
+    # spinboxのボタンが押されたときに値をチェック
+    def spin_changed(self):
+        try:
+            self.var_axis_value.get()
+        except Exception:
+            self.var_axis_value.set(1)
+        if self.var_axis_value.get() < 1:  # 0より下の値を入力した時、1にする
+            self.var_axis_value.set(1)
+
+    # spinboxの増分を設定
+    def set_increment(self):
+        self.sb['increment'] = self.AXIS_UNITS[self.var_axis_unit.get()]
+
+    # チェックボックスに合わせて他のウィジェットのstateを変更する
+    def change_state(self):
+        if self.var_axis_type.get() == 'fix':
+            self.cb['state'] = 'readonly'
+            self.sb['state'] = tk.DISABLED
+            self.set_var_axis_value()
+        elif self.var_axis_type.get() == 'specified':
+            self.cb['state'] = tk.DISABLED
+            self.sb['state'] = tk.NORMAL
+        else:
+            self.cb['state'] = tk.DISABLED
+            self.sb['state'] = tk.DISABLED
+
+
+class ExportDialog(tk.Toplevel):
+    """データ出力の集計単位と出力形式を選択するダイアログ
+    """
+    def __init__(self, master, mean_time: str, on_ok):
+        """初期化
+
+        Args:
+            master: 親ウィジェット
+            mean_time (str): 初期選択する集計単位の名前
+            on_ok (callable): OK時に on_ok(集計単位のリスト, 出力形式) を呼び出す
+        """
+        super().__init__(master=master)
+        self.title('データ出力')
+        self.resizable(width=False, height=False)
+        self.on_ok = on_ok
+
+        # 子フレーム：集計単位（複数選択可） ====================
+        lf = MyLabelFrame(self, text='集計単位')
+        lf.pack(anchor=tk.W, fill=tk.X, padx=4, pady=2)
+        self.var_rules = {}
+        for i, (name, rule) in enumerate(MEAN_TIMES.items()):
+            self.var_rules[rule] = tk.BooleanVar(value=(name == mean_time))
+            tk.Checkbutton(master=lf, text=name, variable=self.var_rules[rule]).grid(
+                row=i // 3, column=i % 3, sticky=tk.W
+            )
+
+        # 子フレーム：出力形式 ====================
+        lf = MyLabelFrame(self, text='出力形式')
+        lf.pack(anchor=tk.W, fill=tk.X, padx=4, pady=2)
+        self.var_format = tk.StringVar(value='csv')
+        for fmt, text in EXPORT_FORMATS.items():
+            state = tk.DISABLED if fmt in ('parquet', 'feather') and pyarrow is None else tk.NORMAL
+            tk.Radiobutton(
+                master=lf, text=text, value=fmt, variable=self.var_format, state=state,
+            ).pack(anchor=tk.W, side=tk.LEFT)
+
+        # ボタン
+        frame = tk.Frame(self)
+        frame.pack(anchor=tk.E, padx=4, pady=4)
+        tk.Button(frame, text='出力', width=8, command=self.ok).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame, text='キャンセル', width=8, command=self.destroy).pack(side=tk.LEFT, padx=2)
+
+        self.transient(master)
+        self.grab_set()
+
+    def ok(self):
+        rules = [rule for rule, var in self.var_rules.items() if var.get()]
+        if not rules:
+            messagebox.showerror('データ出力', '集計単位を選択してください', parent=self)
+            return
+        fmt = self.var_format.get()
+        self.destroy()
+        self.on_ok(rules, fmt)
+
+
+class StoreDialog(tk.Toplevel):
+    """履歴ストアから読み込むターゲットを選択するダイアログ
+    """
+    def __init__(self, master, store: StgStore, on_ok):
+        """初期化
+
+        Args:
+            master: 親ウィジェット
+            store (StgStore): 履歴ストア
+            on_ok (callable): OK時に on_ok(ターゲットアドレス, 対象の情報, 保存済みの日付のリスト) を呼び出す
+        """
+        super().__init__(master=master)
+        self.title('履歴ストアから読込')
+        self.resizable(width=False, height=False)
+        self.on_ok = on_ok
+
+        self.targets = []
+        for target_ip, target in store.targets().items():
+            days = store.days(target_ip)
+            if days:
+                self.targets.append((target_ip, target, days))
+        lf = MyLabelFrame(self, text='ターゲット')
+        lf.pack(anchor=tk.W, fill=tk.X, padx=4, pady=2)
+        self.listbox = tk.Listbox(lf, width=60, height=min(max(len(self.targets), 1), 10))
+        for target_ip, _, days in self.targets:
+            self.listbox.insert(tk.END, f'{target_ip}（{days[0]} ～ {days[-1]}、{len(days):,} 日）')
+        if self.targets:
+            self.listbox.selection_set(0)
+        self.listbox.bind('<Double-Button-1>', lambda event: self.ok())
+        self.listbox.pack(fill=tk.X)
+
+        # ボタン
+        frame = tk.Frame(self)
+        frame.pack(anchor=tk.E, padx=4, pady=4)
+        tk.Button(frame, text='読込', width=8, command=self.ok).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame, text='キャンセル', width=8, command=self.destroy).pack(side=tk.LEFT, padx=2)
+
+        self.transient(master)
+        self.grab_set()
+
+    def ok(self):
+        selection = self.listbox.curselection()
+        if not selection:
+            messagebox.showerror('履歴ストアから読込', 'ターゲットを選択してください', parent=self)
+            return
+        self.destroy()
+        self.on_ok(*self.targets[selection[0]])
+
+
+class PerfDialog(tk.Toplevel):
+    """処理ごとの実行時間、入出力の行数、使用メモリの増減の合計を表示するウィンドウ
+    """
+    COLUMNS = {
+        'calls': ('回数', 50),
+        'wall': ('時間[sec]', 80),
+        'rows_in': ('入力行数', 100),
+        'rows_out': ('出力行数', 100),
+        'mem_delta': ('メモリ増減[MB]', 100),
+    }
+
+    def __init__(self, master):
+        super().__init__(master=master)
+        self.title('パフォーマンス')
+
+        self.tree = ttk.Treeview(self, columns=list(self.COLUMNS), height=len(PERF_STAGES))
+        self.tree.heading('#0', text='処理')
+        self.tree.column('#0', width=120)
+        for key, (text, width) in self.COLUMNS.items():
+            self.tree.heading(key, text=text)
+            self.tree.column(key, width=width, anchor=tk.E)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=4, pady=4)
+
+        tk.Label(self, text=f'ログ：{PERF.log_file}').pack(anchor=tk.W, padx=4)
+        self.var_profile = tk.BooleanVar(value=PERF.profile)
+        tk.Checkbutton(
+            self, text='プロファイル取得（cProfile / tracemalloc）', variable=self.var_profile,
+            command=lambda: PERF.set_profile(self.var_profile.get()),
+        ).pack(anchor=tk.W, padx=4)
+
+        # ボタン
+        frame = tk.Frame(self)
+        frame.pack(anchor=tk.E, padx=4, pady=4)
+        tk.Button(frame, text='更新', width=8, command=self.update_summary).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame, text='クリア', width=8, command=self.clear).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame, text='閉じる', width=8, command=self.destroy).pack(side=tk.LEFT, padx=2)
+
+        self.update_summary()
+
+    def update_summary(self):
+        self.tree.delete(*self.tree.get_children())
+        for stage, row in PERF.summary().iterrows():
+            values = [
+                f'{row.calls:,.0f}',
+                f'{row.wall:,.3f}',
+                '' if pd.isna(row.rows_in) else f'{row.rows_in:,.0f}',
+                '' if pd.isna(row.rows_out) else f'{row.rows_out:,.0f}',
+                '' if pd.isna(row.mem_delta) else f'{row.mem_delta / 2**20:,.1f}',
+            ]
+            self.tree.insert('', tk.END, text=PERF_STAGES.get(stage, stage), values=values)
+
+    def clear(self):
+        PERF.clear()
+        self.update_summary()
+
+
+class AnomalyDialog(tk.Toplevel):
+    """検出した異常（detect_targets_anomaliesの結果）の一覧を表示するウィンドウ
+        行を選択すると on_select(開始日時, 終了日時) を呼び出す（プレビューをその時間帯に移動する）
+    """
+    COLUMNS = {
+        'start': ('開始', 130, tk.W),
+        'end': ('終了', 130, tk.W),
+        'target_ip': ('ターゲット', 110, tk.W),
+        'direction': ('方向', 40, tk.W),
+        'kind': ('種類', 70, tk.W),
+        'value': ('値', 90, tk.E),
+        'baseline': ('基準', 90, tk.E),
+    }
+    DIRECTIONS = {'recv': '受信', 'send': '送信'}
 
-    def wheel(self, event):
-        increment = int(self.sb.config('increment')[-1])  # incrementの現在値を抽出
-        value = self.var_axis_value.get()
-        if (event.delta > 0):  # 上向きホイール
-            value += increment
-        elif (event.delta < 0):  # 下向きホイール
-            value -= increment
-        if value <= 0:
-            value = increment
-        self.var_axis_value.set(value)
+    def __init__(self, master, events: pd.DataFrame, axis_unit: str, on_select):
+        super().__init__(master=master)
+        self.title('異常検知')
+        self.events = events
+        self.on_select = on_select
 
-    def set_var_axis_value(self, event=None):
-        self.var_axis_value.set(self.AXIS_VALUES[self.cb.get()])
+        frame = tk.Frame(self)
+        frame.pack(fill=tk.BOTH, expand=True, padx=4, pady=4)
+        self.tree = ttk.Treeview(frame, columns=list(self.COLUMNS), show='headings', height=15)
+        for key, (text, width, anchor) in self.COLUMNS.items():
+            self.tree.heading(key, text=text)
+            self.tree.column(key, width=width, anchor=anchor)
+        scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree['yscrollcommand'] = scroll.set
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind('<<TreeviewSelect>>', self.select)
 
-    # spinboxのボタンが押されたときに値をチェック
-    def spin_changed(self):
-        try:
-            self.var_axis_value.get()
-        except Exception:
-            self.var_axis_value.set(1)
-        if self.var_axis_value.get() < 1:  # 0より下の値を入力した時、1にする
-            self.var_axis_value.set(1)
+        div_unit = {'bps': 1, 'kbps': int(1e3), 'Mbps': int(1e6), 'Gbps': int(1e9)}[axis_unit]
+        for i, row in enumerate(events.itertuples(index=False)):
+            values = [
+                f'{row.start:%Y-%m-%d %H:%M}',
+                f'{row.end:%Y-%m-%d %H:%M}',
+                row.target_ip,
+                self.DIRECTIONS[row.direction],
+                ANOMALY_KINDS[row.kind],
+                '' if pd.isna(row.value) else f'{row.value / div_unit:,.3f}',
+                '' if pd.isna(row.baseline) else f'{row.baseline / div_unit:,.3f}',
+            ]
+            self.tree.insert('', tk.END, iid=str(i), values=values)
 
-    # spinboxの増分を設定
-    def set_increment(self):
-        self.sb['increment'] = self.AXIS_UNITS[self.var_axis_unit.get()]
+        tk.Label(self, text=f'{len(events):,} 件（値・基準の単位：{axis_unit}）').pack(anchor=tk.W, padx=4)
+        tk.Button(self, text='閉じる', width=8, command=self.destroy).pack(anchor=tk.E, padx=4, pady=4)
 
-    # チェックボックスに合わせて他のウィジェットのstateを変更する
-    def change_state(self):
-        if self.var_axis_type.get() == 'fix':
-            self.cb['state'] = 'readonly'
-            self.sb['state'] = tk.DISABLED
-            self.set_var_axis_value()
-        elif self.var_axis_type.get() == 'specified':
-            self.cb['state'] = tk.DISABLED
-            self.sb['state'] = tk.NORMAL
-        else:
-            self.cb['state'] = tk.DISABLED
-            self.sb['state'] = tk.DISABLED
+    def select(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            row = self.events.iloc[int(selection[0])]
+            self.on_select(row['start'], row['end'])
 
 
 class ButtonFrame(tk.Frame):
@@ -345,13 +3270,38 @@ class ButtonFrame(tk.Frame):
         self.MsgFrame = msg  # メッセージフレーム
         self.filemenu = filemenu
         self.df = pd.DataFrame()
+        self.target_ip = None       # 読込済みのターゲットアドレス（未読込ならNone）
+        self.cache = StgCache()
+        self.store = StgStore()
+        self.from_store = False     # 履歴ストアから読み込んだ場合はTrue（集計時に指定期間だけ読み込む）
+        self.resample_cache = ResampleCache()
+        self.file_info = {}         # ファイル情報（CSV情報）の集計値
+        self.follow_file = None     # 追従モードで読み込むCSVファイル
+        self.follow_offset = 0      # 追従モードで次に読み込む位置
+        self.follow_id = None       # 追従モードのタイマーID
+        self.compare_targets = []   # 比較対象のターゲット（resample_targetsのdict）
+        self.preview_data = []      # プレビューのターゲットごとの (間引く前のデータ, 系列の列名, ターゲットのdict)
+        self.preview_params = None  # プレビューの (集計単位, 集計開始日, 集計終了日, 縦軸の単位)
+        self.preview_lines = []     # プレビューの系列のLine2D
+        self.renderer = None        # プレビューの描画（PreviewRenderer）
+        self.zoom_id = None         # プレビューの間引き直しのタイマーID
+        self.base_rule = None       # ストリーミング集計で読み込んだ場合の集計単位
+        self.repair = {}            # 最後に行ったカウンタ値の補正の情報（追従モードで引き継ぐ）
+        self.follow_buffer = None   # 追従モードで行を追加するself.dfのFrameBuffer
+        self.executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)     # バックグラウンド処理
+        self.jobs = set()           # 実行中のバックグラウンド処理
+        self.preview_job = None     # 実行中のプレビューのリサンプル処理
+        self.preview_pending = False    # プレビューの集計中に条件が変わった（終了後に集計し直す）
+        self.buffer = ThroughputBuffer()    # プレビューのスループットの列のバッファ
+        self.preview_focus = None   # 次のプレビューで表示する時間帯（異常検知の一覧から選択したイベント）
+        self.dashboard = None       # ダッシュボードのWebサーバー（DashboardServer）
         # 読込ボタン
         width = len('ファイル読込') * 2
         self.ReadButton = tk.Button(
             self,
             text='ファイル読込',
             width=width,
-            command=self.read_stg_thread,
+            command=self.read_stg,
         )
         # self.ReadButton.pack(side=tk.LEFT, padx=2, pady=2)
         # プレビューボタン
@@ -372,6 +3322,15 @@ class ButtonFrame(tk.Frame):
             state=tk.DISABLED,
         )
         self.DrawButton.pack(side=tk.LEFT, padx=2, pady=2)
+        # 統計情報ボタン
+        self.StatsButton = tk.Button(
+            self,
+            text='統計情報',
+            width=width,
+            command=self.output_statistics,
+            state=tk.DISABLED,
+        )
+        self.StatsButton.pack(side=tk.LEFT, padx=2, pady=2)
         # 終了ボタン
         self.QuitButton = tk.Button(
             self,
@@ -380,14 +3339,89 @@ class ButtonFrame(tk.Frame):
             command=self.abort
         )
         # self.QuitButton.pack(side=tk.LEFT, padx=2, pady=2)
+        # 中止ボタン
+        self.CancelButton = tk.Button(
+            self,
+            text='中止',
+            width=width // 2,
+            command=self.cancel_jobs,
+            state=tk.DISABLED,
+        )
+        self.CancelButton.pack(side=tk.RIGHT, padx=2, pady=2)
+        # 進捗バー
+        self.ProgressBar = ttk.Progressbar(self, length=160, mode='determinate')
+        self.ProgressBar.pack(side=tk.RIGHT, padx=2, pady=2)
 
     def abort(self):
+        self.cancel_jobs()
+        if self.dashboard is not None:
+            self.dashboard.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
         plt.close('all')
         root.destroy()
 
-    def read_stg_thread(self):
-        th = threading.Thread(target=self.read_stg, args=())
-        th.start()
+    def start_job(self, func, *args, on_done=None, on_error=None, on_cancel=None, **kwargs) -> BackgroundJob:
+        """
+        バックグラウンド処理を開始する
+            funcにはキーワード引数 progress, cancel で進捗の出力と中止の確認の関数を渡す
+        """
+        job = BackgroundJob(
+            self, self.executor,
+            on_done=on_done, on_progress=self._show_progress, on_error=on_error, on_cancel=on_cancel,
+            on_finish=self._finish_job,
+        )
+        self.jobs.add(job)
+        self.CancelButton['state'] = tk.NORMAL
+        self.ProgressBar.config(mode='indeterminate')
+        self.ProgressBar.start()
+        return job.start(func, *args, progress=job.progress, cancel=job.check_cancel, **kwargs)
+
+    def _show_progress(self, text: str, done: int = None, total: int = None):
+        """
+        バックグラウンド処理の進捗を表示する
+        """
+        if text:
+            self.MsgFrame.write(text)
+        if total:
+            self.ProgressBar.stop()
+            self.ProgressBar.config(mode='determinate', maximum=total, value=done)
+
+    def _finish_job(self, job: BackgroundJob):
+        """
+        バックグラウンド処理の終了時の処理
+        """
+        self.jobs.discard(job)
+        if job is self.preview_job:
+            self.preview_job = None
+            if self.preview_pending:
+                self.preview_pending = False
+                self.preview_graph()
+        if not self.jobs:
+            self.CancelButton['state'] = tk.DISABLED
+            self.ProgressBar.stop()
+            self.ProgressBar.config(mode='determinate', value=0)
+
+    def cancel_jobs(self):
+        """
+        実行中のバックグラウンド処理を中止する
+        """
+        for job in self.jobs:
+            job.cancel()
+
+    def _lock_buttons(self, lock: bool = True):
+        """
+        読込中にボタンとメニューをロック（解除）する
+        """
+        state = tk.DISABLED if lock else tk.NORMAL
+        self.ReadButton['state'] = state
+        self.DrawButton['state'] = state
+        self.PreviewButton['state'] = state
+        self.StatsButton['state'] = state
+        self.filemenu.entryconfigure('CSVファイル読込', state=state)
+        self.filemenu.entryconfigure('履歴ストアから読込', state=state)
+        self.filemenu.entryconfigure('CSVファイル出力', state=state)
+        self.filemenu.entryconfigure('データ出力（形式・集計単位を選択）', state=state)
+        self.filemenu.entryconfigure('比較対象を追加', state=state)
 
     def read_stg(self):
         # ファイルダイアログを開く
@@ -399,258 +3433,692 @@ class ButtonFrame(tk.Frame):
             return
 
         self.MsgFrame.write(f'\n{now()} CSVファイル読込開始（{len(csv_filenames)} files）\n')
+        self.stop_follow()
 
-        # CSVファイルのチェック
-        for idx, filename in enumerate(csv_filenames):
-            line = ''
-            # ファイルを開いて1行読み込み
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    line = f.readline().rstrip()  # 1行読み込み
-            except UnicodeDecodeError as err:
-                self.MsgFrame.write(f'Error!：文字コードエラー\n  {filename}\n')
-                messagebox.showerror('文字コードエラー', f'文字コードがUTF-8ではありません\n{filename}\n{err}')
-                return
-            except Exception as err:
-                self.MsgFrame.write(f'Error!：ファイルオープンエラー\n  {filename}\n')
-                messagebox.showerror('ファイルオープンエラー', f'ファイルが開けません\n{filename}\n{err}')
-                return
+        # 追記中のCSVファイル（ローテーション前の*.csv）は読込前のサイズを追従モードの開始位置とする
+        #   読込中に追記された行は、追従モードで読み込んだときに日時で除外する
+        active = [f for f in csv_filenames if f.lower().endswith('.csv')]
+        self.follow_file = active[-1] if active else None
+        self.follow_offset = os.path.getsize(self.follow_file) if active else 0
 
-            # チェック１：STGのファイルであることのチェック
-            #   行頭がSTGでカンマ区切りで5カラムあること
-            columns = line.split(',')
-            if line.startswith('STG') is False or len(columns) != 5:
-                self.MsgFrame.write(f'Error!：ファイルフォーマットエラー\n  {filename}\n')
-                messagebox.showerror(
-                    'ファイルフォーマットエラー',
-                    f'STGのCSVファイルではありません\n{filename}'
-                )
-                return
-            # ターゲットアドレスを取得
-            m = re.match('Target Address:(.+)', columns[1])
-            if not m:
-                self.MsgFrame.write(f'Error!：ファイルフォーマットエラー\n  {filename}\n')
-                messagebox.showerror(
-                    'ファイルフォーマットエラー',
-                    f'STGのCSVファイルではありません\n{filename}'
-                )
-                return
-            self.target_ip = m.group(1)
-
-            # チェック２：Target情報が前に読み込んだファイルと一致するかチェック
-            if idx == 0:  # ファイル1個目
-                target = columns[1:]
-            elif target != columns[1:]:
-                self.MsgFrame.write(f'Error!：ファイル指定エラー\n  {filename}\n')
-                messagebox.showerror(
-                    'ファイル指定エラー',
-                    f'{os.path.basename(filename)} の対象情報が一致しません'
-                )
+        # CSVファイルのチェックと読込（バックグラウンドで実行する）
+        #   ストリーミング集計の場合は、選択中の集計単位で集計しながら読み込む
+        base_rule = None
+        if var_stream.get():
+            base_rule = MEAN_TIMES[self.var_mean_time.get()]
+            if base_rule == 'org':
+                self.MsgFrame.write('Error!：ストリーミング集計では生データは選択できません\n')
+                messagebox.showerror('集計単位エラー', 'ストリーミング集計では生データ以外の集計単位を選択してください')
                 return
+            self.follow_file = None     # 集計済みのデータには追記できない
+            self.MsgFrame.write(f' ストリーミング集計（{self.var_mean_time.get()}）\n')
 
-        # CSVファイルの読込
-        self.ReadButton['state'] = tk.DISABLED  # ReadButtonをロック
-        self.DrawButton['state'] = tk.DISABLED  # DrawButtonをロック
-        self.PreviewButton['state'] = tk.DISABLED
-        self.filemenu.entryconfigure('CSVファイル読込', state=tk.DISABLED)
-        self.filemenu.entryconfigure('CSVファイル出力', state=tk.DISABLED)
-        t = ExecTime()
-
-        # CSVファイルをDataFrameとして読み込み、self.dfに結合する
-        self.df = pd.DataFrame()
-        for idx, filename in enumerate(csv_filenames):
-            self.MsgFrame.write(f' [{idx+1}/{len(csv_filenames)}] "{filename}" ... ')
-            df = pd.read_csv(
-                filename,
-                encoding='SHIFT-JIS',                       # 文字コードを指定
-                header=1,                                   # 0行目（最初の行）を読み飛ばす
-                names=['date', 'uptime', 'recv', 'send'],   # カラム名を設定
-            )
-            # STGのバグでAugがAvgになっているので、置換して日時認識する
-            df['date'] = pd.to_datetime(
-                df['date'].str.replace('Avg', 'Aug'), format="%Y-%b-%d %H:%M:%S.%f"
-            )
-            # uptimeが0の行は読み取り失敗のため削除する
-            df.drop(df.query('uptime == 0').index, inplace=True)
-            # uptimeの列を削除する
-            df.drop('uptime', axis=1, inplace=True)
-            self.df = pd.concat([self.df, df])
-            self.MsgFrame.write(f'{t.laptime:.3f} sec\n')
+        self._lock_buttons()
+        if base_rule is None:
+            job_args = (load_stg_files, csv_filenames, self.cache)
+        else:
+            job_args = (stream_stg_files, csv_filenames, base_rule)
+        self.start_job(
+            *job_args,
+            repair=var_repair.get(),
+            on_done=lambda result: self._on_loaded(*result, csv_filenames, base_rule),
+            on_error=self._on_load_error,
+            on_cancel=self._on_load_cancel,
+        )
 
+    def _on_loaded(self, df: pd.DataFrame, target: list, target_ip: str, csv_filenames: list,
+                   base_rule: str = None):
+        """
+        CSVファイルの読込完了時の処理
+        """
+        self.df = df
+        self.target_ip = target_ip
+        self.base_rule = base_rule
+        self.from_store = False
         self.MsgFrame.write(f'{now()} CSVファイル読込完了\n')
 
         # カレントディレクトの変更
         os.chdir(os.path.dirname(csv_filenames[0]))
         # self.MsgFrame.write(f' ファイル出力先：{os.getcwd()}\n')
-        # 重複行を削除する
-        self.df.drop_duplicates(inplace=True)
-        # 'date'をインデックスにする
-        self.df.set_index('date', inplace=True)
-        # インデックス順（日時）でソートする
-        self.df.sort_index(inplace=True)
-        # 1行目を削除する（取得値が非常に大きい場合があるため）
-        self.df.drop(self.df.index[0], inplace=True)
-        # delta_timeを計算する
-        self.df['delta_time'] = self.df.index.to_series().diff().dt.total_seconds()
 
         # 機器情報出力
         self.TargetFrame.write(target)
         # ファイル情報出力
-        recv = self.df['recv'] * 8 // self.df['delta_time']
-        send = self.df['send'] * 8 // self.df['delta_time']
-        delta = self.df['delta_time']
-        text = [
-            f'開始日時: {str(self.df.index[0])[:-7]}',
-            f'終了日時: {str(self.df.index[-1])[:-7]}',
-            f'取得間隔: {delta.min():,.2} ～ {delta.max():,.2} 秒',
-            f'取得行数: {self.df.shape[0]:,}',
-            f'受信帯域: 最大 {int(recv.max()):,} bps',
-            f'送信帯域: 最大 {int(send.max()):,} bps',
-        ]
-        self.FileInfoFrame.write(text)
+        self.file_info = {}
+        self.repair = {}
+        self.follow_buffer = None
+        self._update_file_info(self.df)
         # 期間情報設定
-        self.PeriodFrame.set_values(sorted(set(self.df.index.date)))
+        self._set_period_values()
+
+        self._lock_buttons(False)
+
+        self._build_pyramid(self._targets()[0])
+        if base_rule is None:
+            self._import_store(target_ip, target, df)
+        self.preview_graph()
+        self.start_follow()
+
+    def _import_store(self, target_ip: str, target: list, df: pd.DataFrame):
+        """
+        読み込んだデータを履歴ストアにバックグラウンドで追加する（保存済みの日時の行は追加しない）
+        """
+        if not var_store.get():
+            return
+        self.start_job(
+            self.store.append, target_ip, target, df,
+            on_done=lambda rows: self.MsgFrame.write(f'{now()} 履歴ストアに追加：{target_ip}（{rows:,} 行）\n'),
+            on_error=lambda err: self.MsgFrame.write(f'{now()} Error!：履歴ストア追加エラー\n  {err}\n'),
+        )
+
+    def read_store(self):
+        """
+        履歴ストアから読み込むターゲットを選択する
+        """
+        if not self.store.targets():
+            messagebox.showinfo('履歴ストアから読込', f'履歴ストアにデータがありません\n{self.store.store_dir}')
+            return
+        StoreDialog(self, self.store, self._on_store_selected)
+
+    def _on_store_selected(self, target_ip: str, target: list, days: list):
+        """
+        履歴ストアのターゲットを読み込む
+            全期間は読み込まず、集計時に指定期間の日のデータだけを読み込む（初期の期間は最終日）
+        """
+        self.MsgFrame.write(
+            f'\n{now()} 履歴ストア読込：{target_ip}（{days[0]} ～ {days[-1]}、{len(days):,} 日）\n'
+        )
+        self.stop_follow()
+        self.follow_file = None
+        self.target_ip = target_ip
+        self.base_rule = None
+        self.from_store = True
+        self.resample_cache.clear()
+        self.df = self.store.query(target_ip, days[-1], days[-1])
+
+        self.TargetFrame.write(target)
+        self.file_info = {}
+        self.repair = {}
+        self.follow_buffer = None
+        self._update_file_info(self.df)
+        self._set_period_values()
+        self.var_from.set(days[-1])
+        self.var_to.set(days[-1])
+
+        self._lock_buttons(False)
+        self.preview_graph()
+
+    def _build_pyramid(self, target: dict):
+        """
+        ターゲットの全集計単位をバックグラウンドで集計しておく（ResampleCache.build）
+        """
+        t = ExecTime()
+        self.start_job(
+            target['resample_cache'].build, target['df'], target['base_rule'],
+            on_done=lambda _: self.MsgFrame.write(
+                f'{now()} 集計単位ごとの集計完了：{target["target_ip"]}（{t.laptime:.3f} sec）\n'
+            ),
+            on_error=self._on_resample_error,
+        )
+
+    def _targets(self) -> list:
+        """
+        読込済みのターゲット（先頭が機器情報のターゲット、以降は比較対象）
+        """
+        target = {
+            'target_ip': self.target_ip,
+            'df': self.df,
+            'resample_cache': self.resample_cache,
+            'base_rule': self.base_rule,
+            'store': self.store if self.from_store else None,
+            'buffer': self.buffer,
+        }
+        return [target] + self.compare_targets
+
+    def _set_period_values(self):
+        """
+        期間情報にすべてのターゲットの日付を設定する
+        """
+        dates = set()
+        for target in self._targets():
+            if target['store'] is not None:
+                dates.update(datetime.date.fromisoformat(d) for d in target['store'].days(target['target_ip']))
+            else:
+                dates.update(target['df'].index.date)
+        self.PeriodFrame.set_values(sorted(dates))
+
+    def read_compare_stg(self):
+        """
+        比較対象のターゲットのCSVファイルを読み込む
+            ターゲットごとに別のDataFrameとリサンプル結果のキャッシュを持つ
+        """
+        filetypes = [('STGローテーションファイル', '*.csv;*.csv.*'), ('すべて', '*'), ]
+        csv_filenames = filedialog.askopenfilenames(filetypes=filetypes, initialdir='.',
+                                                    title='比較対象のCSVファイルを選択')
+        if csv_filenames == '':
+            return
+
+        self.MsgFrame.write(f'\n{now()} 比較対象のCSVファイル読込開始（{len(csv_filenames)} files）\n')
+        self._lock_buttons()
+        self.start_job(
+            load_stg_files, csv_filenames, self.cache,
+            repair=var_repair.get(),
+            on_done=lambda result: self._on_compare_loaded(*result),
+            on_error=self._on_load_error,
+            on_cancel=self._on_load_cancel,
+        )
 
-        self.ReadButton['state'] = tk.NORMAL  # ReadButtonをロック解除
-        self.DrawButton['state'] = tk.NORMAL  # DrawButtonをロック解除
-        self.PreviewButton['state'] = tk.NORMAL  # PreviewButtonをロック解除
-        self.filemenu.entryconfigure('CSVファイル読込', state=tk.NORMAL)
-        self.filemenu.entryconfigure('CSVファイル出力', state=tk.NORMAL)
+    def _on_compare_loaded(self, df: pd.DataFrame, target: list, target_ip: str):
+        """
+        比較対象のCSVファイルの読込完了時の処理
+            同じターゲットを読み込んだ場合は置き換える
+        """
+        self._lock_buttons(False)
+        if target_ip == self.target_ip:
+            self.MsgFrame.write(f'Error!：{target_ip} は機器情報のターゲットと同じです\n')
+            messagebox.showerror('ファイル指定エラー', f'{target_ip} は機器情報のターゲットと同じです')
+            return
+        self.compare_targets = [t for t in self.compare_targets if t['target_ip'] != target_ip]
+        self.compare_targets.append({
+            'target_ip': target_ip,
+            'df': df,
+            'resample_cache': ResampleCache(),
+            'base_rule': None,
+            'store': None,
+            'buffer': ThroughputBuffer(),
+        })
+        self.MsgFrame.write(f'{now()} 比較対象のCSVファイル読込完了：{target_ip}（{df.shape[0]:,} 行）\n')
+        self._build_pyramid(self.compare_targets[-1])
+        self._import_store(target_ip, target, df)
 
+        at_last = self.var_to.get() == self.PeriodFrame.cb_to['values'][-1]
+        date_from, date_to = self.var_from.get(), self.var_to.get()
+        self._set_period_values()
+        # 選択中の期間は変更しない（終了日が最終日の場合は最終日に合わせる）
+        self.var_from.set(date_from)
+        if not at_last:
+            self.var_to.set(date_to)
         self.preview_graph()
 
-    def _resample_df(self) -> tuple:
+    def clear_compare(self):
         """
-        リサンプルしたDataFrameと各種変数を返す
+        比較対象のターゲットをすべて削除する
         """
-        rule = MEAN_TIMES[self.var_mean_time.get()]
-        axis_unit = self.var_axis_unit.get()
+        if not self.compare_targets:
+            return
+        self.compare_targets = []
+        self.MsgFrame.write(f'\n{now()} 比較対象クリア\n')
+        if not self.df.empty:
+            self._set_period_values()
+            self.preview_graph()
 
-        # 指定時間で集約
-        if rule == 'org':
-            df = self.df.copy()
+    def _on_load_error(self, err: Exception):
+        """
+        CSVファイルの読込エラー時の処理
+            ファイルのエラーは、すべてのファイルのエラーをまとめて表示する
+        """
+        if isinstance(err, StgLoadError):
+            for e in err.errors:
+                self.MsgFrame.write(f'Error!：{e.title}\n  {e.filename}\n')
+            # メッセージボックスには先頭の10ファイル分を表示する
+            text = '\n\n'.join(f'［{e.title}］\n{e.message}' for e in err.errors[:10])
+            if len(err.errors) > 10:
+                text += f'\n\n...他 {len(err.errors) - 10} ファイル'
+            messagebox.showerror('ファイルエラー', f'{len(err.errors)} ファイルにエラーがあります\n\n{text}')
         else:
-            df = self.df.resample(rule=rule).sum()
-            # df['delta_time'] = df.index.to_series().diff().dt.total_seconds()
-
-        # 指定期間を抽出
-        df = df[self.var_from.get():self.var_to.get()]
-
-        # スループットを計算
-        if axis_unit == 'bps':
-            div_unit = 1
-        elif axis_unit == 'kbps':
-            div_unit = int(1e3)
-        elif axis_unit == 'Mbps':
-            div_unit = int(1e6)
-        elif axis_unit == 'Gbps':
-            div_unit = int(1e9)
-
-        recv_unit = 'recv_' + axis_unit
-        send_unit = 'send_' + axis_unit
-        df[recv_unit] = df['recv'] * 8 // df['delta_time'] / div_unit
-        df[send_unit] = df['send'] * 8 // df['delta_time'] / div_unit
-
-        # # CSVファイル出力
-        # output_columns = ['delta_time', recv_unit, send_unit]
-        # df[output_columns].to_csv(f'{self.target_ip}_{var_mean_time.get()}.csv', sep=',')
-
-        # 送受信の最大値と発生日時を調べる
-        recv_max = df[recv_unit].max()
-        send_max = df[send_unit].max()
-        recv_max_date = re.sub(r'\.\d+$', '', str(df[df[recv_unit] == recv_max].index.tolist()[0]))
-        send_max_date = re.sub(r'\.\d+$', '', str(df[df[send_unit] == send_max].index.tolist()[0]))
-
-        # 送受信の最大値の文字列を作成、MbpsとGbpsは少数点3桁表示
-        if axis_unit == 'Mbps' or axis_unit == 'Gbps':
-            recv_max_str = f'{recv_max:,.3f}'
-            send_max_str = f'{send_max:,.3f}'
+            self.MsgFrame.write(f'{now()} Error!：CSVファイル読込エラー\n  {err}\n')
+            messagebox.showerror('CSVファイル読込エラー', f'CSVファイルが読み込めません\n{err}')
+        self._lock_buttons(False)
+        if self.df.empty:
+            self.DrawButton['state'] = tk.DISABLED
+            self.PreviewButton['state'] = tk.DISABLED
+            self.StatsButton['state'] = tk.DISABLED
+            self.filemenu.entryconfigure('CSVファイル出力', state=tk.DISABLED)
+            self.filemenu.entryconfigure('データ出力（形式・集計単位を選択）', state=tk.DISABLED)
+            self.filemenu.entryconfigure('比較対象を追加', state=tk.DISABLED)
+
+    def _on_load_cancel(self):
+        """
+        CSVファイルの読込中止時の処理
+        """
+        self.MsgFrame.write(f'{now()} CSVファイル読込中止\n')
+        self._lock_buttons(False)
+        if self.df.empty:
+            self.DrawButton['state'] = tk.DISABLED
+            self.PreviewButton['state'] = tk.DISABLED
+            self.StatsButton['state'] = tk.DISABLED
+            self.filemenu.entryconfigure('CSVファイル出力', state=tk.DISABLED)
+            self.filemenu.entryconfigure('データ出力（形式・集計単位を選択）', state=tk.DISABLED)
+            self.filemenu.entryconfigure('比較対象を追加', state=tk.DISABLED)
         else:
-            recv_max_str = f'{int(recv_max):,}'
-            send_max_str = f'{int(send_max):,}'
+            self.start_follow()
 
-        strlen_max = max(len(recv_max_str), len(send_max_str))
+    def _update_file_info(self, df: pd.DataFrame):
+        """
+        ファイル情報をdfの行の分だけ更新して表示する
+        """
+        recv = throughput(df['recv'], df['delta_time'])
+        send = throughput(df['send'], df['delta_time'])
+        delta = df['delta_time']
+        info = {
+            'start': df.index[0],
+            'end': df.index[-1],
+            'delta_min': delta.min(),
+            'delta_max': delta.max(),
+            'rows': df.attrs.get('rows', df.shape[0]),
+            'recv_max': recv.max(),
+            'send_max': send.max(),
+        }
+        # カウンタ値の補正の件数
+        repair = df.attrs.get('repair', {})
+        for key in ['restart', 'short', 'negative', 'gap']:
+            info[key] = repair.get(key, 0)
+        if repair:
+            self.repair = repair
+        if self.file_info:
+            prev = self.file_info
+            info['start'] = prev['start']
+            for key in ['rows', 'restart', 'short', 'negative', 'gap']:
+                info[key] += prev[key]
+            for key in ['delta_min']:
+                info[key] = np.nanmin([prev[key], info[key]])
+            for key in ['delta_max', 'recv_max', 'send_max']:
+                info[key] = np.nanmax([prev[key], info[key]])
+        self.file_info = info
 
-        str1 = f'受信MAX: {recv_max_str:>{strlen_max}} {axis_unit} ({recv_max_date})'
-        str2 = f'送信MAX: {send_max_str:>{strlen_max}} {axis_unit} ({send_max_date})'
+        if self.base_rule is None:
+            interval = f'取得間隔: {info["delta_min"]:,.2} ～ {info["delta_max"]:,.2} 秒'
+        else:
+            interval = f'集計単位: {self.base_rule}（ストリーミング集計）'
+        text = [
+            f'開始日時: {str(info["start"])[:-7]}',
+            f'終了日時: {str(info["end"])[:-7]}',
+            interval,
+            f'取得行数: {info["rows"]:,}',
+            f'受信帯域: 最大 {int(info["recv_max"]):,} bps',
+            f'送信帯域: 最大 {int(info["send_max"]):,} bps',
+            f'使用メモリ: {self.df.memory_usage().sum() / 1024**2:,.1f} MB',
+            f'補正: 再起動 {info["restart"]:,} / 間隔異常 {info["short"]:,} / 負の値 {info["negative"]:,} 件'
+            f'（欠測 {info["gap"]:,} 件）' if self.repair else '補正: なし',
+        ]
+        self.FileInfoFrame.write(text)
 
-        return (df, recv_unit, send_unit, axis_unit, div_unit, str1, str2)
+    def start_follow(self):
+        """
+        追従モードのタイマーを開始する
+        """
+        self.stop_follow()
+        if var_follow.get() and self.follow_file and not self.df.empty:
+            self.follow_id = self.after(FOLLOW_INTERVAL_MS, self.follow_stg)
 
-    def _adjust_axes(self, ax, axis_unit, div_unit, r_max, s_max):
-        # X軸ラベル
-        ax.set_xlabel('日時')
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d %H:%M'))
-        ax.xaxis.set_minor_locator(AutoMinorLocator(6))
-        # Y軸ラベル
-        ax.set_ylabel(axis_unit)
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, loc: f'{x:,.1f}'))
-        ax.yaxis.set_minor_locator(AutoMinorLocator())
-        # グリッド線
-        ax.grid(visible=True, axis='both', which='major', color='gray', linestyle='--', alpha=0.9)
-        ax.grid(visible=True, axis='both', which='minor', color='gray', linestyle='--', alpha=0.2)
-        # Y軸のスケール
-        if var_axis_type.get() == 'auto':
-            ax.set_ylim(0,)
+    def stop_follow(self):
+        """
+        追従モードのタイマーを停止する
+        """
+        if self.follow_id is not None:
+            self.after_cancel(self.follow_id)
+            self.follow_id = None
+
+    def toggle_follow(self):
+        """
+        メニューで追従モードが切り替えられたときの処理
+        """
+        if var_follow.get():
+            if self.follow_file:
+                self.MsgFrame.write(f'\n{now()} 追従モード開始\n  "{self.follow_file}"\n')
+            self.start_follow()
         else:
-            ax.set_ylim([0, var_axis_value.get() // div_unit])
+            self.stop_follow()
+
+    def toggle_dashboard(self):
+        """
+        メニューでダッシュボードが切り替えられたときの処理
+            読込済みのターゲットのグラフとCSVをWebサーバーで提供する
+        """
+        if var_dashboard.get():
+            host = DASHBOARD_PUBLIC_HOST if var_dashboard_public.get() else DASHBOARD_HOST
+            self.dashboard = DashboardServer(self._targets, host)
+            try:
+                self.dashboard.start()
+            except OSError as err:
+                self.dashboard = None
+                var_dashboard.set(False)
+                self.MsgFrame.write(f'{now()} Error!：ダッシュボード開始エラー\n  {err}\n')
+                messagebox.showerror('ダッシュボード開始エラー', f'Webサーバーを開始できません\n{err}')
+                return
+            self.MsgFrame.write(f'\n{now()} ダッシュボード開始\n  {self.dashboard.url}\n')
+        elif self.dashboard is not None:
+            self.dashboard.stop()
+            self.dashboard = None
+            self.MsgFrame.write(f'\n{now()} ダッシュボード停止\n')
+
+    def toggle_dashboard_public(self):
+        """
+        メニューでダッシュボードの他のPCへの公開が切り替えられたときの処理
+            公開する場合は確認してから、実行中のWebサーバーを待ち受けるアドレスを変えて開始し直す
+        """
+        if var_dashboard_public.get() and not messagebox.askokcancel(
+            'ダッシュボードの公開',
+            'ダッシュボードを同じネットワークの他のPCに公開しますか？\n'
+            '認証はないため、アクセスできる人はだれでも読込済みのデータを表示できます。',
+        ):
+            var_dashboard_public.set(False)
+            return
+        if self.dashboard is not None:
+            self.dashboard.stop()
+            self.dashboard = None
+            self.toggle_dashboard()
+
+    def follow_stg(self):
+        """
+        追記中のCSVファイルの追記分だけを読み込み、self.dfに追加してプレビューを更新する
+            読込と集計はバックグラウンドで行う（読込済みのデータはコピーしない）
+        """
+        self.follow_id = None
+        df = self.df
+        self.start_job(
+            append_stg_tail, self.follow_file, self.follow_offset, df, self.follow_buffer, self.resample_cache,
+            self.repair,
+            on_done=lambda result: self._on_follow_appended(df, *result),
+            on_error=self._on_follow_error,
+            on_cancel=self.start_follow,
+        )
+
+    def _on_follow_appended(self, prev: pd.DataFrame, df: pd.DataFrame, tail: pd.DataFrame, offset: int,
+                            buffer: FrameBuffer):
+        if prev is not self.df:
+            return      # 追記分の読込中に別のデータを読み込んだ
+        self.follow_offset = offset
+        self.follow_buffer = buffer
+        if not tail.empty:
+            self.df = df
+            self.MsgFrame.write(f'{now()} 追従モード：{tail.shape[0]:,} 行追加\n')
+            self._update_file_info(tail)
+            # 期間情報に新しい日付を追加する（終了日が最終日の場合は最終日に合わせる）
+            dates = list(self.PeriodFrame.cb_to['values'])
+            new_dates = [str(d) for d in sorted(set(tail.index.date)) if str(d) not in dates]
+            if new_dates:
+                at_last = self.var_to.get() == dates[-1]
+                self.PeriodFrame.cb_from['values'] = dates + new_dates
+                self.PeriodFrame.cb_to['values'] = dates + new_dates
+                if at_last:
+                    self.var_to.set(new_dates[-1])
+            self.preview_graph()
+        self.start_follow()
+
+    def _on_follow_error(self, err: Exception):
+        self.MsgFrame.write(f'{now()} Error!：追従モード読込エラー\n  {self.follow_file}\n  {err}\n')
+        self.start_follow()
+
+    def clear_cache(self):
+        """
+        読込済みCSVファイルのキャッシュを削除する
+        """
+        size = self.cache.size
+        if not messagebox.askokcancel(
+            'キャッシュ削除', f'キャッシュ（{size / 1024**2:,.1f} MB）を削除しますか？\n{self.cache.cache_dir}'
+        ):
+            return
+        count = self.cache.clear()
+        self.MsgFrame.write(f'\n{now()} キャッシュ削除（{count} files）\n')
+
+    def _resample_df(self, on_done, statistics: bool = False, reuse_buffers: bool = False) -> BackgroundJob:
+        """
+        ターゲットごとにリサンプルしたDataFrameと各種変数をバックグラウンドで並列に求め、on_doneに渡す
+            statisticsがTrueの場合は、統計値も求めて (ターゲットアドレス, リサンプル結果, 統計値) を渡す
+            reuse_buffersがTrueの場合は、スループットの列をターゲットのバッファに書き込む（プレビュー用）
+            Tkの変数はワーカースレッドから参照できないため、ここで値を取得してから開始する
+        """
+        args = (
+            self._targets(),
+            MEAN_TIMES[self.var_mean_time.get()],
+            self.var_from.get(),
+            self.var_to.get(),
+            self.var_axis_unit.get(),
+            reuse_buffers,
+        )
+        threshold = var_threshold.get()
+
+        def job(progress, cancel):
+            results = resample_targets(*args, cancel=cancel)
+            if not statistics:
+                return results
+            targets, rule, date_from, date_to, axis_unit, _ = args
+            targets = {t['target_ip']: t for t in targets}
+            outputs = []
+            for target_ip, resampled in results:
+                t = targets[target_ip]
+                hourly = hourly_frame(
+                    target_stg_frame(t, date_from, date_to), rule, date_from, date_to, axis_unit,
+                    cache=t['resample_cache'], base_rule=t['base_rule'],
+                )
+                outputs.append(
+                    (target_ip, resampled, stg_statistics(*resampled[:3], threshold / resampled[4], hourly))
+                )
+                cancel()
+            return outputs
+
+        return self.start_job(
+            job,
+            on_done=on_done,
+            on_error=self._on_resample_error,
+        )
 
-        # 送受信の最大値をグラフ上にテキスト表示
-        ax.text(0.05, 0.9, r_max + '\n' + s_max, family='ms gothic', transform=ax.transAxes)
+    def _on_resample_error(self, err: Exception):
+        self.MsgFrame.write(f'{now()} Error!：集計エラー\n  {err}\n')
+        messagebox.showerror('集計エラー', f'集計できません\n{err}')
+
+    def _plot_targets(self, ax, results: list):
+        plot_targets(ax, results, var_mean_time.get(), var_axis_type.get(), var_axis_value.get())
 
     def output_graph(self):
         """
         指定の時間でスループットを計算してグラフ表示する
         """
-        (df, recv_unit, send_unit, axis_unit, div_unit, r_max, s_max) = self._resample_df()
-
-        # グラフ描画
-        ax = df.plot(
-            grid=True,
-            y=[recv_unit, send_unit],
-            title=f'{self.target_ip} スループット（{var_mean_time.get()}）',
-            rot=30,
-            x_compat=True
-            )
+        self._resample_df(self._output_graph)
 
-        # axesの見栄えを調整する
-        self._adjust_axes(ax, axis_unit, div_unit, r_max, s_max)
+    def _output_graph(self, results: list):
+        # グラフ描画（比較対象がある場合は、重ねるか時間軸を共有して上下に並べる）
+        if var_compare_layout.get() == 'subplots':
+            fig, axes = plt.subplots(len(results), 1, sharex=True, squeeze=False)
+            for ax, result in zip(axes[:, 0], results):
+                self._plot_targets(ax, [result])
+        else:
+            fig, ax = plt.subplots()
+            self._plot_targets(ax, results)
 
         plt.show()
 
     def preview_graph(self):
         """
         グラフをプレビューする
+            前回のプレビューの集計が終わっていなければ中止して、終了後に新しい条件で集計し直す
+            （スループットのバッファを同時に使わないよう、プレビューの集計は1つずつ行う）
         """
-        (df, recv_unit, send_unit, axis_unit, div_unit, r_max, s_max) = self._resample_df()
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+            self.preview_pending = True
+            return
+        self.preview_job = self._resample_df(self._preview_graph, reuse_buffers=True)
 
-        # グラフ描画
-        ax.cla()
-        df.plot(
-            ax=ax,
-            grid=True,
-            y=[recv_unit, send_unit],
-            title=f'{self.target_ip} スループット（{var_mean_time.get()}）',
-            rot=30,
-            x_compat=True
-            )
+    def _preview_graph(self, results: list):
+        # 結果を表示するので、次の集計でバッファの結果を上書きしないようにする
+        #   （中止した集計の結果はcommitしないので、表示中の結果は上書きされない）
+        for target in self._targets():
+            target['buffer'].commit()
+        # 拡大・移動したときに表示範囲を間引き直すため、間引く前のデータとターゲット（細かいデータ用）を保持する
+        targets = {t['target_ip']: t for t in self._targets()}
+        self.preview_data = []
+        self.preview_params = (
+            MEAN_TIMES[self.var_mean_time.get()], self.var_from.get(), self.var_to.get(), self.var_axis_unit.get(),
+        )
+        decimated = []
+        for target_ip, (df, recv_unit, send_unit, *rest) in results:
+            self.preview_data.append((df, [recv_unit, send_unit], targets.get(target_ip)))
+            # 描画領域のピクセル幅に合わせて間引く（最大値はr_max, s_maxとして間引く前に計算済み）
+            idx = decimate_m4(df.index.asi8, [df[recv_unit], df[send_unit]], int(ax.bbox.width))
+            if len(idx) < df.shape[0]:
+                df = df.iloc[idx]
+            decimated.append((target_ip, (df, recv_unit, send_unit, *rest)))
+
+        # グラフ描画（比較対象は重ねて表示する）
+        #   2回目以降は系列のデータだけを更新する
+        if self.renderer is None:
+            self.renderer = PreviewRenderer(ax)
+        if self.renderer.draw(decimated, var_mean_time.get(), var_axis_type.get(), var_axis_value.get()):
+            # ツールバーで拡大・移動したら表示範囲を間引き直す（ax.cla()で登録は解除される）
+            ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+        self.preview_lines = self.renderer.lines
+        # 表示範囲の更新による間引き直しは不要（間引いたばかりのため）
+        if self.zoom_id is not None:
+            self.after_cancel(self.zoom_id)
+            self.zoom_id = None
+        # 異常検知の一覧から選択した時間帯に拡大する（表示範囲の変更で間引き直す）
+        if self.preview_focus is not None:
+            ax.set_xlim(mdates.date2num([t.to_datetime64() for t in self.preview_focus]))
+            self.preview_focus = None
+
+        canvas.draw_idle()
+
+    def _on_xlim_changed(self, event_ax):
+        """
+        プレビューの表示範囲が変わったときの処理
+            連続した拡大・移動では間引き直さず、最後の変更からZOOM_DEBOUNCE_MS後に1回だけ処理する
+        """
+        if self.zoom_id is not None:
+            self.after_cancel(self.zoom_id)
+        self.zoom_id = self.after(ZOOM_DEBOUNCE_MS, self._redecimate_preview)
+
+    def _redecimate_preview(self):
+        """
+        プレビューの表示範囲のデータを抽出して間引き直す
+            表示範囲が狭ければ、選択中の集計単位より細かいデータ（元データなど）から求める（zoom_frame参照）
+        """
+        self.zoom_id = None
+        x_from, x_to = [pd.Timestamp(mdates.num2date(x)).tz_convert(None).value for x in ax.get_xlim()]
+        rule, date_from, date_to, axis_unit = self.preview_params
+        lines = iter(self.preview_lines)
+        for df, columns, target in self.preview_data:
+            if df.empty:
+                continue
+            zoomed = None
+            if target is not None:
+                zoomed = zoom_frame(target, rule, date_from, date_to, x_from, x_to, int(ax.bbox.width), axis_unit)
+            if zoomed is not None:
+                df = zoomed[0]
+            else:
+                # 表示範囲の行を二分探索で求める（線が途切れないよう前後1行を含める）
+                index = df.index.asi8
+                start = max(np.searchsorted(index, x_from, side='left') - 1, 0)
+                stop = min(np.searchsorted(index, x_to, side='right') + 1, len(index))
+                df = df.iloc[start:stop]
+
+            idx = decimate_m4(df.index.asi8, [df[c] for c in columns], int(ax.bbox.width))
+            x = mdates.date2num(df.index[idx].to_numpy())
+            for line, column in zip(lines, columns):
+                line.set_data(x, df[column].to_numpy()[idx])
+        canvas.draw_idle()
+
+    def output_statistics(self):
+        """
+        指定の集計単位・期間のスループットの統計情報を表示する
+        """
+        self._resample_df(self._output_statistics, statistics=True)
+
+    def _output_statistics(self, results: list):
+        self.MsgFrame.write(
+            f'\n{now()} 統計情報（{var_mean_time.get()} {self.var_from.get()} ～ {self.var_to.get()}、'
+            f'閾値 {var_threshold.get():,} bps）\n'
+        )
+        for target_ip, (df, recv_unit, send_unit, axis_unit, *_), (summary, busiest) in results:
+            self.MsgFrame.write(f' {target_ip}\n{format_statistics(summary, axis_unit)}\n')
+            if busiest.empty:
+                self.MsgFrame.write('  日ごとのピーク時間帯：1時間より粗く集計したデータのため求められません\n')
+                continue
+            self.MsgFrame.write('  日ごとのピーク時間帯（1時間平均）\n')
+            for date, (r_hour, r_peak, s_hour, s_peak) in busiest.iterrows():
+                self.MsgFrame.write(
+                    f'    {date}: 受信 {r_hour} {r_peak:,.3f} {axis_unit} / 送信 {s_hour} {s_peak:,.3f} {axis_unit}\n'
+                )
 
-        # axesの見栄えを調整する
-        self._adjust_axes(ax, axis_unit, div_unit, r_max, s_max)
+    def output_anomalies(self):
+        """
+        読み込んだターゲットのバースト、平坦、レベル変化をバックグラウンドで検出して一覧を表示する
+        """
+        if self.df.empty:
+            return
+        self.MsgFrame.write(f'\n{now()} 異常検知開始\n')
+        self.start_job(
+            detect_targets_anomalies,
+            self._targets(),
+            self.var_from.get(),
+            self.var_to.get(),
+            var_threshold.get() or None,
+            on_done=self._output_anomalies,
+            on_error=lambda err: self.MsgFrame.write(f'{now()} Error!：異常検知エラー\n  {err}\n'),
+            on_cancel=lambda: self.MsgFrame.write(f'{now()} 異常検知中止\n'),
+        )
 
-        canvas.draw()
+    def _output_anomalies(self, events: pd.DataFrame):
+        counts = events['kind'].value_counts()
+        self.MsgFrame.write(
+            f'{now()} 異常検知完了（{len(events):,} 件：'
+            f'{"、".join(f"{label} {counts.get(kind, 0):,}" for kind, label in ANOMALY_KINDS.items())}）\n'
+        )
+        AnomalyDialog(self, events, self.var_axis_unit.get(), self._jump_to_event)
+
+    def _jump_to_event(self, start: pd.Timestamp, end: pd.Timestamp):
+        """
+        対象期間をイベントの日に変更し、プレビューをイベントの前後を含む時間帯に拡大する
+        """
+        dates = list(self.PeriodFrame.cb_to['values'])
+        date_from, date_to = str(start.date()), str((end - pd.Timedelta(1)).date())
+        if date_from not in dates or date_to not in dates:
+            return
+        self.var_from.set(date_from)
+        self.var_to.set(date_to)
+        margin = max(end - start, pd.Timedelta(minutes=30))
+        self.preview_focus = (start - margin, end + margin)
+        self.preview_graph()
 
     def output_csv(self):
         """
-        CSVファイルを出力する
+        選択中の集計単位のCSVファイルを出力する
+        """
+        self._export([MEAN_TIMES[self.var_mean_time.get()]], 'csv')
+
+    def export_data(self):
+        """
+        集計単位（複数可）と出力形式を選択してデータを出力する
+        """
+        ExportDialog(self, self.var_mean_time.get(), self._export)
+
+    def _export(self, rules: list, fmt: str):
+        """
+        ターゲットごとにスループットと統計情報のファイルをバックグラウンドで出力する
+            ファイルはchunk単位で書き込み、複数の集計単位は元データを1回だけ集計して出力する
         """
-        (df, recv_unit, send_unit, *_) = self._resample_df()
+        names = {v: k for k, v in MEAN_TIMES.items()}
+        self.MsgFrame.write(
+            f'\n{now()} データ出力開始（{EXPORT_FORMATS[fmt]}：{"、".join(names[rule] for rule in rules)}）\n'
+        )
+        self.start_job(
+            export_targets,
+            self._targets(),
+            rules,
+            self.var_from.get(),
+            self.var_to.get(),
+            self.var_axis_unit.get(),
+            fmt,
+            var_threshold.get(),
+            on_done=lambda outputs: self.MsgFrame.write(f'{now()} データ出力完了（{len(outputs)} files）\n'),
+            on_error=self._on_export_error,
+            on_cancel=lambda: self.MsgFrame.write(f'{now()} データ出力中止\n'),
+        )
 
-        # CSVファイル出力
-        output_fname = f'{self.target_ip}_{var_mean_time.get()}.csv'
-        output_columns = ['delta_time', recv_unit, send_unit]
-        df[output_columns].to_csv(output_fname, sep=',')
-        self.MsgFrame.write(f'\n{now()} CSVファイル出力\n')
-        self.MsgFrame.write(f' "{os.path.abspath(output_fname)}"\n')
+    def _on_export_error(self, err: Exception):
+        self.MsgFrame.write(f'{now()} Error!：データ出力エラー\n  {err}\n')
+        messagebox.showerror('データ出力エラー', f'データが出力できません\n{err}')
 
 
 class ExecTime():
@@ -670,10 +4138,154 @@ class ExecTime():
         print(f'{self.laptime:.3f} sec')
 
 
+# =================================================================
+# コマンドラインでの一括出力
+# =================================================================
+def render_target(job: dict) -> dict:
+    """1ターゲット分のグラフとCSVファイルを出力する（Tkのウィジェットは使用しない）
+        ProcessPoolExecutorのワーカーで実行する
+
+    Args:
+        job (dict): batch_mainで作成した処理内容
+
+    Returns:
+        dict: 処理結果（ターゲットアドレス、出力ファイル、エラーメッセージ、処理時間）
+    """
+    t = ExecTime()
+    result = {'patterns': job['patterns'], 'target_ip': None, 'outputs': [], 'error': None}
+    try:
+        filenames = sorted({f for pattern in job['patterns'] for f in glob.glob(pattern)})
+        if not filenames:
+            raise FileNotFoundError(f'ファイルがありません: {" ".join(job["patterns"])}')
+        df, target, target_ip = load_stg_files(
+            filenames, StgCache() if job['cache'] else None, repair=job['repair'],
+        )
+        result['target_ip'] = target_ip
+
+        frame = df
+        resampled = resample_stg(frame, job['rule'], job['date_from'], job['date_to'], job['axis_unit'])
+        (df, recv_unit, send_unit, *_) = resampled
+        if df.empty:
+            raise ValueError(f'指定期間（{job["date_from"]} ～ {job["date_to"]}）のデータがありません')
+        basename = os.path.join(job['outdir'], f'{target_ip}_{job["mean_time"]}')
+
+        # グラフ出力（pyplotを使わずAggで描画する）
+        if job['formats']:
+            fig = plot_figure(
+                [(target_ip, resampled)], job['mean_time'], job['figsize'], job['axis_type'], job['axis_value'],
+            )
+            for fmt in job['formats']:
+                fig.savefig(f'{basename}.{fmt}', format=fmt)
+                result['outputs'].append(f'{basename}.{fmt}')
+
+        # CSVファイル出力（スループットと統計情報）
+        if job['csv']:
+            output_columns = ['delta_time', recv_unit, send_unit]
+            export_frame(df[output_columns], f'{basename}.csv')
+            result['outputs'].append(f'{basename}.csv')
+            threshold = None if job['threshold'] is None else job['threshold'] / resampled[4]
+            hourly = hourly_frame(frame, job['rule'], job['date_from'], job['date_to'], job['axis_unit'])
+            write_statistics_csv(
+                f'{basename}_統計.csv', *stg_statistics(df, recv_unit, send_unit, threshold, hourly),
+            )
+            result['outputs'].append(f'{basename}_統計.csv')
+    except StgLoadError as err:
+        result['error'] = '\n'.join(f'{e.title}: {e.filename}' for e in err.errors)
+    except Exception as err:
+        result['error'] = f'{type(err).__name__}: {err}'
+    result['time'] = t.laptime
+    return result
+
+
+def batch_main(argv: list = None) -> int:
+    """コマンドラインで指定されたターゲットのグラフとCSVファイルを一括出力する
+
+    Returns:
+        int: 終了コード（エラーがあれば1）
+    """
+    parser = argparse.ArgumentParser(
+        description='STGのCSVファイルからスループットのグラフ・CSVファイルを一括出力する',
+    )
+    parser.add_argument(
+        '-t', '--target', nargs='+', action='append', required=True, metavar='GLOB',
+        help='1ターゲット分のCSVファイル（ワイルドカード可、複数指定可）。ターゲットごとに指定する',
+    )
+    parser.add_argument(
+        '-m', '--mean-time', default='1分平均',
+        help='集計単位（"1分平均" などの名前、または "1T" などの値）',
+    )
+    parser.add_argument('--from', dest='date_from', help='集計開始日（YYYY-MM-DD）')
+    parser.add_argument('--to', dest='date_to', help='集計終了日（YYYY-MM-DD）')
+    parser.add_argument('-u', '--unit', default='Mbps', choices=['bps', 'kbps', 'Mbps', 'Gbps'], help='縦軸の単位')
+    parser.add_argument('--axis-value', type=int, help='縦軸の高さ（bps）。省略時は自動')
+    parser.add_argument(
+        '-f', '--format', nargs='*', default=['png'], choices=['png', 'svg'],
+        help='グラフの出力形式（複数指定可、指定なしでグラフを出力しない）',
+    )
+    parser.add_argument('--csv', action='store_true', help='CSVファイル（スループットと統計情報）も出力する')
+    parser.add_argument('--threshold', type=int, help='統計情報の閾値（bps）。省略時は閾値を超えた時間を出力しない')
+    parser.add_argument('--size', nargs=2, type=float, default=[10, 6], metavar=('W', 'H'), help='グラフのサイズ（インチ）')
+    parser.add_argument('-o', '--outdir', default='.', help='出力先のディレクトリ')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='並列に処理するプロセス数')
+    parser.add_argument('--no-cache', action='store_true', help='読込済みCSVファイルのキャッシュを使用しない')
+    parser.add_argument('--no-repair', action='store_true', help='カウンタ値を補正しない（再起動・取得間隔の異常）')
+    args = parser.parse_args(argv)
+
+    # 集計単位は名前と値のどちらでも指定可能
+    names = {v: k for k, v in MEAN_TIMES.items()}
+    if args.mean_time in MEAN_TIMES:
+        mean_time = args.mean_time
+    elif args.mean_time in names:
+        mean_time = names[args.mean_time]
+    else:
+        parser.error(f'集計単位が不正です: {args.mean_time}（{", ".join(MEAN_TIMES.values())}）')
+
+    os.makedirs(args.outdir, exist_ok=True)
+    jobs = [
+        {
+            'patterns': patterns,
+            'mean_time': mean_time,
+            'rule': MEAN_TIMES[mean_time],
+            'date_from': args.date_from,
+            'date_to': args.date_to,
+            'axis_unit': args.unit,
+            'axis_type': 'auto' if args.axis_value is None else 'specified',
+            'axis_value': args.axis_value or 0,
+            'threshold': args.threshold,
+            'formats': args.format,
+            'csv': args.csv,
+            'figsize': args.size,
+            'outdir': args.outdir,
+            'cache': not args.no_cache,
+            'repair': not args.no_repair,
+        }
+        for patterns in args.target
+    ]
+
+    print(f'{now()} 一括出力開始（{len(jobs)} targets）')
+    errors = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for count, result in enumerate(executor.map(render_target, jobs)):
+            name = result['target_ip'] or ' '.join(result['patterns'])
+            if result['error']:
+                errors += 1
+                print(f' [{count+1}/{len(jobs)}] {name} ... Error!：{result["error"]}')
+                continue
+            print(f' [{count+1}/{len(jobs)}] {name} ... {result["time"]:.3f} sec')
+            for output in result['outputs']:
+                print(f'  "{os.path.abspath(output)}"')
+    print(f'{now()} 一括出力完了（エラー {errors} targets）')
+    return 1 if errors else 0
+
+
 # =================================================================
 # メインルーチン
 # =================================================================
 if __name__ == '__main__':
+    # 引数があればコマンドラインで一括出力する（GUIは起動しない）
+    if len(sys.argv) > 1:
+        sys.exit(batch_main(sys.argv[1:]))
+
     root = tk.Tk()
     root.withdraw()
 
@@ -683,11 +4295,35 @@ if __name__ == '__main__':
     # File Menu
     filemenu = tk.Menu(menubar, tearoff=0)
     filemenu.add_command(label='CSVファイル読込')
+    filemenu.add_command(label='履歴ストアから読込')
     filemenu.add_command(label='CSVファイル出力')
+    filemenu.add_command(label='データ出力（形式・集計単位を選択）')
     filemenu.add_separator()
-    filemenu.add_command(label='終了', command=root.destroy)
+    filemenu.add_command(label='比較対象を追加')
+    filemenu.add_command(label='比較対象をクリア')
+    comparemenu = tk.Menu(filemenu, tearoff=0)
+    comparemenu.add_radiobutton(label='重ねて表示', value='overlay')
+    comparemenu.add_radiobutton(label='上下に並べて表示', value='subplots')
+    filemenu.add_cascade(label='比較表示', menu=comparemenu)
+    filemenu.add_separator()
+    filemenu.add_command(label='キャッシュ削除')
+    filemenu.add_separator()
+    filemenu.add_checkbutton(label='追従モード')
+    filemenu.add_checkbutton(label='ストリーミング集計（大容量ファイル）')
+    filemenu.add_checkbutton(label='カウンタ値を補正（再起動・取得間隔の異常）')
+    filemenu.add_checkbutton(label='履歴ストアに保存')
+    filemenu.add_separator()
+    filemenu.add_command(label='終了')
     # Add
     menubar.add_cascade(label='ファイル', underline=0, menu=filemenu)
+    # View Menu
+    viewmenu = tk.Menu(menubar, tearoff=0)
+    viewmenu.add_command(label='パフォーマンス')
+    viewmenu.add_command(label='異常検知')
+    viewmenu.add_separator()
+    viewmenu.add_checkbutton(label='ダッシュボード（Webサーバー）')
+    viewmenu.add_checkbutton(label='ダッシュボードを他のPCに公開')
+    menubar.add_cascade(label='表示', underline=0, menu=viewmenu)
 
     # ウィジェット共通の変数
     var_axis_unit = tk.StringVar(value='Mbps')  # 縦軸の単位 bps / kbps / Mbps / Gbps
@@ -696,6 +4332,14 @@ if __name__ == '__main__':
     var_mean_time = tk.StringVar()             # 集計時間単位（n分平均）
     var_from = tk.StringVar()             # 集計開始日
     var_to = tk.StringVar()             # 集計終了日
+    var_follow = tk.BooleanVar(value=False)     # 追従モード
+    var_stream = tk.BooleanVar(value=False)     # ストリーミング集計
+    var_repair = tk.BooleanVar(value=True)      # 読込時にカウンタ値を補正する
+    var_store = tk.BooleanVar(value=True)       # 読み込んだデータを履歴ストアに保存する
+    var_compare_layout = tk.StringVar(value='overlay')  # 比較表示 overlay / subplots
+    var_threshold = tk.IntVar(value=int(100e6))     # 統計情報の閾値（bps）
+    var_dashboard = tk.BooleanVar(value=False)  # ダッシュボードのWebサーバー
+    var_dashboard_public = tk.BooleanVar(value=False)   # ダッシュボードを他のPCに公開する
 
     # tkinterのウィジェット設定
 
@@ -704,7 +4348,7 @@ if __name__ == '__main__':
     target_frame.grid(row=0, column=0)
 
     # ファイル情報
-    fileinfo_frame = InformationFrame(master=root, lines=6, text='CSV情報')
+    fileinfo_frame = InformationFrame(master=root, lines=8, text='CSV情報')
     fileinfo_frame.grid(row=0, column=1)
 
     # 集計単位の選択
@@ -748,8 +4392,27 @@ if __name__ == '__main__':
     toolbar.grid(row=4, column=2, sticky=tk.W)
 
     # ファイルメニュー
-    filemenu.entryconfigure('CSVファイル読込', command=button_frame.read_stg_thread, state=tk.NORMAL)
+    filemenu.entryconfigure('CSVファイル読込', command=button_frame.read_stg, state=tk.NORMAL)
+    filemenu.entryconfigure('履歴ストアから読込', command=button_frame.read_store, state=tk.NORMAL)
     filemenu.entryconfigure('CSVファイル出力', command=button_frame.output_csv, state=tk.DISABLED)
+    filemenu.entryconfigure('データ出力（形式・集計単位を選択）', command=button_frame.export_data, state=tk.DISABLED)
+    filemenu.entryconfigure('比較対象を追加', command=button_frame.read_compare_stg, state=tk.DISABLED)
+    filemenu.entryconfigure('比較対象をクリア', command=button_frame.clear_compare)
+    for label in ['重ねて表示', '上下に並べて表示']:
+        comparemenu.entryconfigure(label, variable=var_compare_layout)
+    filemenu.entryconfigure('キャッシュ削除', command=button_frame.clear_cache)
+    filemenu.entryconfigure('追従モード', variable=var_follow, command=button_frame.toggle_follow)
+    filemenu.entryconfigure('ストリーミング集計（大容量ファイル）', variable=var_stream)
+    filemenu.entryconfigure('カウンタ値を補正（再起動・取得間隔の異常）', variable=var_repair)
+    filemenu.entryconfigure('履歴ストアに保存', variable=var_store)
+    filemenu.entryconfigure('終了', command=button_frame.abort)
+    viewmenu.entryconfigure('パフォーマンス', command=lambda: PerfDialog(root))
+    viewmenu.entryconfigure('異常検知', command=button_frame.output_anomalies)
+    viewmenu.entryconfigure('ダッシュボード（Webサーバー）', variable=var_dashboard, command=button_frame.toggle_dashboard)
+    viewmenu.entryconfigure(
+        'ダッシュボードを他のPCに公開', variable=var_dashboard_public, command=button_frame.toggle_dashboard_public
+    )
+    root.protocol('WM_DELETE_WINDOW', button_frame.abort)
 
     root.title(f'STG Graph Plot  ver. {__version__}')
     root.resizable(width=False, height=False)